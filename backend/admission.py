@@ -0,0 +1,106 @@
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Optional
+
+from resilience import NonRetryableError
+
+# 优先级从高到低
+PRIORITIES = ("interactive", "background")
+
+
+class AdmissionError(NonRetryableError):
+    """请求未被准入(等待队列已满或等待超时)"""
+
+
+class AdmissionController:
+    """
+    LLM请求准入控制
+    同时进行的请求数不超过max_in_flight，其中reserved_interactive个只给交互请求使用，
+    超出时按优先级排队(同优先级先到先得)，等待队列有上限，每个优先级有各自的最长等待时间
+    """
+    def __init__(
+        self,
+        max_in_flight: int = 4,
+        reserved_interactive: int = 1,
+        max_waiting: int = 64,
+        timeouts: Optional[Dict[str, float]] = None
+    ):
+        self.max_in_flight = max_in_flight
+        self.max_waiting = max_waiting
+        self.timeouts = timeouts or {}
+        self.limits = {
+            "interactive": max_in_flight,
+            "background": max(max_in_flight - reserved_interactive, 1)
+        }
+        self._running = {priority: 0 for priority in PRIORITIES}
+        self._queues: Dict[str, Deque[asyncio.Future]] = {priority: deque() for priority in PRIORITIES}
+
+    @property
+    def in_flight(self) -> int:
+        return sum(self._running.values())
+
+    @property
+    def waiting(self) -> int:
+        return sum(1 for queue in self._queues.values() for future in queue if not future.done())
+
+    def _can_run(self, priority: str) -> bool:
+        return self.in_flight < self.max_in_flight and self._running[priority] < self.limits[priority]
+
+    def _has_waiters(self, priority: str) -> bool:
+        """同优先级或更高优先级是否有人在排队"""
+        for name in PRIORITIES:
+            if any(not future.done() for future in self._queues[name]):
+                return True
+            if name == priority:
+                return False
+        return False
+
+    def _dispatch(self) -> None:
+        """把空出的名额按优先级分给排队的请求"""
+        for priority in PRIORITIES:
+            queue = self._queues[priority]
+            while queue and self._can_run(priority):
+                future = queue.popleft()
+                if future.done():
+                    continue
+                self._running[priority] += 1
+                future.set_result(None)
+
+    async def acquire(self, priority: str = "interactive") -> None:
+        if priority not in self._running:
+            priority = "interactive"
+        if not self._has_waiters(priority) and self._can_run(priority):
+            self._running[priority] += 1
+            return
+        if self.waiting >= self.max_waiting:
+            raise AdmissionError("等待队列已满")
+        
+        future = asyncio.get_running_loop().create_future()
+        self._queues[priority].append(future)
+        self._dispatch()
+        try:
+            await asyncio.wait({future}, timeout=self.timeouts.get(priority))
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release(priority)
+            future.cancel()
+            raise
+        if not future.done():
+            future.cancel()
+            raise AdmissionError(f"等待超过{self.timeouts.get(priority)}秒")
+
+    def release(self, priority: str = "interactive") -> None:
+        if priority not in self._running:
+            priority = "interactive"
+        self._running[priority] -= 1
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, priority: str = "interactive"):
+        """占用一个名额直到退出"""
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release(priority)
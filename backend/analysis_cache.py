@@ -0,0 +1,70 @@
+import hashlib
+import json
+import time
+from typing import Any, Dict, Optional
+
+from config import Config
+from sqlite_cache import SQLiteLRUCache
+
+# 结果格式版本，可视化数据结构变化时递增使旧缓存失效
+RESULT_VERSION = 2
+
+
+def file_hash(file_path: str, block_size: int = 1024 * 1024) -> str:
+    """分块计算文件内容的sha256"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class AnalysisCache(SQLiteLRUCache):
+    """
+    数据分析结果缓存
+    键为(文件内容哈希, 分析要求, 提示词模板版本, 模型)，结果(分析文本和可视化数据)连同写入时间以JSON保存，
+    超过TTL的条目读取时视为未命中
+    """
+    def __init__(self, path: str, ttl: float, memory_size: int = 16, max_entries: int = 500):
+        super().__init__(path, "analyses", "entry", memory_size, max_entries)
+        self.ttl = ttl
+
+    @staticmethod
+    def make_key(content_hash: str, requirement: Optional[str], template: str, model: str) -> str:
+        template_version = hashlib.sha256(template.encode("utf-8")).hexdigest()[:16]
+        raw = json.dumps([RESULT_VERSION, content_hash, requirement or "", template_version, model], ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _encode(self, entry: Dict[str, Any]) -> str:
+        return json.dumps(entry, ensure_ascii=False)
+
+    def _decode(self, raw: str) -> Dict[str, Any]:
+        return json.loads(raw)
+
+    def _is_fresh(self, entry: Dict[str, Any]) -> bool:
+        return time.time() - entry["created_at"] <= self.ttl
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = super().get(key)
+        return entry["result"] if entry else None
+
+    def put(self, key: str, result: Dict[str, Any]) -> None:
+        super().put(key, {"created_at": time.time(), "result": result})
+
+
+_cache: Optional[AnalysisCache] = None
+
+
+def get_analysis_cache() -> Optional[AnalysisCache]:
+    """获取全局共享的分析结果缓存，未启用时返回None"""
+    global _cache
+    if not Config.ANALYSIS_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        _cache = AnalysisCache(
+            Config.ANALYSIS_CACHE_PATH,
+            ttl=Config.ANALYSIS_CACHE_TTL,
+            memory_size=Config.ANALYSIS_CACHE_MEMORY_SIZE,
+            max_entries=Config.ANALYSIS_CACHE_MAX_ENTRIES
+        )
+    return _cache
@@ -0,0 +1,250 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+
+from config import Config
+from executors import run_blocking
+from memory_index import MemoryIndexer
+
+
+class ArchiveQueue:
+    """
+    对话归档队列
+    归档任务先写入SQLite，保证重启后不丢失；后台worker按批取出任务，
+    按轮次切分成chunk、批量获取embedding后写入各会话的记忆集合，embedding失败的任务按指数退避重试
+    每个会话的轮次序号也保存在这里，重启后继续递增
+    """
+    def __init__(self, path: str, batch_size: int = 16):
+        self.path = path
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._submitting: Set[asyncio.Task] = set()  # 正在线程池中写入的任务，停止前等待完成
+        self._collections: Dict[str, object] = {}
+        self._embedding_function = None
+        self.indexer = MemoryIndexer()
+        
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS archive_jobs ("
+            "id TEXT PRIMARY KEY, session_id TEXT NOT NULL, content TEXT NOT NULL, "
+            "timestamp TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, "
+            "next_attempt REAL NOT NULL)"
+        )
+        # 按轮次归档的任务content保存对话列表(JSON)，first_turn_index为第一轮的序号；
+        # 旧版任务first_turn_index为空，content是整段文本
+        columns = [row[1] for row in self._db.execute("PRAGMA table_info(archive_jobs)")]
+        if "first_turn_index" not in columns:
+            self._db.execute("ALTER TABLE archive_jobs ADD COLUMN first_turn_index INTEGER")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS turn_counters ("
+            "session_id TEXT PRIMARY KEY, next_turn_index INTEGER NOT NULL)"
+        )
+        self._db.commit()
+
+    def enqueue(self, session_id: str, turns: List[Dict[str, str]]) -> str:
+        """
+        添加归档任务并唤醒worker，返回任务ID(同步写入SQLite，事件循环中请使用submit)
+        turns为[{"ask", "answer", "timestamp"}]，同时为这些轮次分配会话内递增的序号
+        """
+        job_id = self._insert(session_id, turns)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job_id
+
+    def submit(self, session_id: str, turns: List[Dict[str, str]]) -> None:
+        """在事件循环中提交归档任务：写入SQLite放到memory线程池，不阻塞请求；没有运行中的事件循环时直接写入"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.enqueue(session_id, turns)
+            return
+        task = loop.create_task(run_blocking("memory", Config.MEMORY_MAX_WORKERS, self._insert, session_id, turns))
+        self._submitting.add(task)
+        task.add_done_callback(self._on_submitted)
+
+    def _on_submitted(self, task: asyncio.Task) -> None:
+        self._submitting.discard(task)
+        if not task.cancelled() and task.exception():
+            print(f"写入归档任务失败: {task.exception()}")
+        elif self._wakeup is not None:
+            self._wakeup.set()
+
+    def _insert(self, session_id: str, turns: List[Dict[str, str]]) -> str:
+        job_id = str(uuid.uuid4())
+        with self._lock:
+            row = self._db.execute(
+                "SELECT next_turn_index FROM turn_counters WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            first_turn_index = row[0] if row else 0
+            self._db.execute(
+                "INSERT OR REPLACE INTO turn_counters (session_id, next_turn_index) VALUES (?, ?)",
+                (session_id, first_turn_index + len(turns))
+            )
+            self._db.execute(
+                "INSERT INTO archive_jobs (id, session_id, content, timestamp, next_attempt, first_turn_index) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, session_id, json.dumps(turns, ensure_ascii=False),
+                 datetime.now().isoformat(), time.time(), first_turn_index)
+            )
+            self._db.commit()
+        return job_id
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM archive_jobs").fetchone()[0]
+
+    def _take_due_jobs(self) -> List[Tuple[str, str, str, str, int, Optional[int]]]:
+        with self._lock:
+            return self._db.execute(
+                "SELECT id, session_id, content, timestamp, attempts, first_turn_index FROM archive_jobs "
+                "WHERE next_attempt <= ? ORDER BY next_attempt LIMIT ?",
+                (time.time(), self.batch_size)
+            ).fetchall()
+
+    def _next_due_in(self) -> float:
+        """距离下一个任务到期的秒数，没有任务时返回轮询间隔"""
+        with self._lock:
+            row = self._db.execute("SELECT MIN(next_attempt) FROM archive_jobs").fetchone()
+        if row[0] is None:
+            return Config.ARCHIVE_POLL_INTERVAL
+        return min(max(row[0] - time.time(), 0.0), Config.ARCHIVE_POLL_INTERVAL)
+
+    def _complete(self, job_ids: List[str]) -> None:
+        with self._lock:
+            self._db.executemany("DELETE FROM archive_jobs WHERE id = ?", [(job_id,) for job_id in job_ids])
+            self._db.commit()
+
+    def _postpone(self, jobs: List[tuple]) -> None:
+        with self._lock:
+            for job_id, _, _, _, attempts, _ in jobs:
+                delay = min(Config.ARCHIVE_RETRY_DELAY * (2 ** attempts), Config.ARCHIVE_MAX_RETRY_DELAY)
+                self._db.execute(
+                    "UPDATE archive_jobs SET attempts = ?, next_attempt = ? WHERE id = ?",
+                    (attempts + 1, time.time() + delay, job_id)
+                )
+            self._db.commit()
+
+    def _get_collection(self, session_id: str):
+        # 延迟导入，避免与conversation模块循环依赖
+        from conversation import APIEmbeddingFunction, get_chroma_client, memory_collection_name
+        
+        collection = self._collections.get(session_id)
+        if collection is None:
+            if self._embedding_function is None:
+                self._embedding_function = APIEmbeddingFunction()
+            collection = get_chroma_client().get_or_create_collection(
+                name=memory_collection_name(session_id),
+                embedding_function=self._embedding_function
+            )
+            self._collections[session_id] = collection
+        return collection
+
+    def _job_chunks(self, job: tuple) -> List[Tuple[str, str, Dict]]:
+        """把任务拆分成[(id, 文本, 元数据)]"""
+        job_id, session_id, content, timestamp, _, first_turn_index = job
+        if first_turn_index is None:
+            return [(job_id, content, {"timestamp": timestamp, "session_id": session_id})]
+        return self.indexer.build_chunks(json.loads(content), session_id, first_turn_index, job_id)
+
+    def process_batch(self) -> int:
+        """处理一批到期的任务，返回成功归档的轮数(在线程池中运行)"""
+        jobs = self._take_due_jobs()
+        if not jobs:
+            return 0
+        
+        try:
+            job_chunks = [self._job_chunks(job) for job in jobs]
+            self._get_collection(jobs[0][1])
+            embeddings = iter(self._embedding_function.embedding_service.get_embeddings(
+                [text for chunks in job_chunks for _, text, _ in chunks]
+            ))
+        except Exception as e:
+            # 向量库或embedding服务整体不可用：整批按指数退避推迟，而不是每个轮询间隔都重试
+            print(f"归档批次失败，{len(jobs)}条任务稍后重试: {e}")
+            self._postpone(jobs)
+            return 0
+        
+        done, failed = [], []
+        by_session: Dict[str, List[Tuple[tuple, list]]] = {}
+        for job, chunks in zip(jobs, job_chunks):
+            items = [(chunk, next(embeddings)) for chunk in chunks]
+            # 任务中任意一个chunk没有拿到embedding，整个任务稍后重试
+            if any(embedding is None for _, embedding in items):
+                failed.append(job)
+            else:
+                by_session.setdefault(job[1], []).append((job, items))
+        
+        archived = 0
+        for session_id, session_jobs in by_session.items():
+            items = [item for _, job_items in session_jobs for item in job_items]
+            try:
+                # chunk的ID由任务ID派生，重试时不会重复写入
+                self._get_collection(session_id).upsert(
+                    ids=[chunk[0] for chunk, _ in items],
+                    documents=[chunk[1] for chunk, _ in items],
+                    embeddings=[embedding for _, embedding in items],
+                    metadatas=[chunk[2] for chunk, _ in items]
+                )
+                done.extend(job[0] for job, _ in session_jobs)
+                archived += len(items)
+            except Exception as e:
+                print(f"写入会话{session_id}的记忆失败: {e}")
+                failed.extend(job for job, _ in session_jobs)
+        
+        if done:
+            self._complete(done)
+        if failed:
+            print(f"{len(failed)}条归档任务失败，稍后重试")
+            self._postpone(failed)
+        return archived
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                archived = await run_blocking("memory", Config.MEMORY_MAX_WORKERS, self.process_batch)
+            except Exception as e:
+                print(f"归档worker出错: {e}")
+                archived = 0
+            if archived:
+                print(f"已归档{archived}个记忆片段")
+                continue
+            
+            # 没有到期任务时等待新任务，或等到下一个重试任务到期
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self._next_due_in())
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self) -> None:
+        """启动后台worker，重启前未完成的任务会继续处理"""
+        if self._worker is None:
+            self._wakeup = asyncio.Event()
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        # 等待已提交的任务写入SQLite，重启后继续处理
+        await asyncio.gather(*self._submitting, return_exceptions=True)
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
+
+
+_queue: Optional[ArchiveQueue] = None
+
+
+def get_archive_queue() -> ArchiveQueue:
+    """获取全局共享的归档队列"""
+    global _queue
+    if _queue is None:
+        _queue = ArchiveQueue(Config.ARCHIVE_QUEUE_PATH, batch_size=Config.ARCHIVE_BATCH_SIZE)
+    return _queue
@@ -0,0 +1,174 @@
+import asyncio
+import hashlib
+import os
+import threading
+import time
+import uuid
+from typing import BinaryIO, Dict, List, Optional
+
+from config import Config
+from executors import run_blocking
+
+
+class ArtifactStore:
+    """
+    临时文件(上传文件和填写结果)管理
+    文件直接存放在root目录下，修改时间作为最近访问时间：
+    超过TTL未访问的文件被删除，总大小超过配额时按最近访问时间从旧到新淘汰；
+    上传文件按内容哈希命名，相同内容只保存一份；正在被任务使用的文件不会被淘汰
+    """
+    def __init__(self, root: str, ttl: float, max_bytes: int, sweep_interval: float = 300):
+        self.root = root
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.sweep_interval = sweep_interval
+        self._lock = threading.Lock()
+        self._leases: Dict[str, int] = {}
+        self._sweeper: Optional[asyncio.Task] = None
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, name: str) -> Optional[str]:
+        """文件名对应的路径，文件名不合法或文件不存在时返回None"""
+        if not name or os.path.basename(name) != name or name.startswith("."):
+            return None
+        file_path = os.path.join(self.root, name)
+        return file_path if os.path.isfile(file_path) else None
+
+    def touch(self, file_path: str) -> None:
+        """刷新最近访问时间"""
+        try:
+            os.utime(file_path)
+        except OSError:
+            pass
+
+    def save_upload(self, source: BinaryIO, extension: str, lease: bool = False) -> str:
+        """
+        保存上传文件，返回文件路径
+        先边写临时文件边计算哈希，再以哈希命名；已存在相同内容的文件时丢弃新文件
+        lease为True时在落盘的同时加租约，之后由调用方release，避免交给任务前被淘汰
+        """
+        tmp_path = os.path.join(self.root, f".{uuid.uuid4()}.part")
+        digest = hashlib.sha256()
+        try:
+            with open(tmp_path, "wb") as f:
+                for block in iter(lambda: source.read(Config.ARTIFACT_BLOCK_SIZE), b""):
+                    digest.update(block)
+                    f.write(block)
+            file_path = os.path.join(self.root, digest.hexdigest()[:32] + extension)
+            with self._lock:
+                if os.path.exists(file_path):
+                    os.remove(tmp_path)
+                else:
+                    os.replace(tmp_path, file_path)
+                if lease:
+                    name = os.path.basename(file_path)
+                    self._leases[name] = self._leases.get(name, 0) + 1
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.touch(file_path)
+        self.enforce_quota()
+        return file_path
+
+    def output_path(self, source_path: str, suffix: str = "_filled.csv") -> str:
+        """为处理结果分配唯一的输出路径，避免同一上传文件的多次处理互相覆盖"""
+        stem = os.path.splitext(os.path.basename(source_path))[0]
+        return os.path.join(self.root, f"{stem}_{uuid.uuid4().hex[:8]}{suffix}")
+
+    def acquire(self, *paths: str) -> None:
+        """标记文件正在使用，使用期间不会被淘汰"""
+        with self._lock:
+            for file_path in paths:
+                name = os.path.basename(file_path)
+                self._leases[name] = self._leases.get(name, 0) + 1
+        for file_path in paths:
+            self.touch(file_path)
+
+    def release(self, *paths: str) -> None:
+        with self._lock:
+            for file_path in paths:
+                name = os.path.basename(file_path)
+                if self._leases.get(name, 0) <= 1:
+                    self._leases.pop(name, None)
+                else:
+                    self._leases[name] -= 1
+
+    def _list(self) -> List[os.DirEntry]:
+        return [entry for entry in os.scandir(self.root) if entry.is_file()]
+
+    def _remove(self, entry: os.DirEntry) -> bool:
+        if entry.name in self._leases:
+            return False
+        try:
+            os.remove(entry.path)
+            return True
+        except OSError:
+            return False
+
+    def sweep(self) -> int:
+        """删除过期文件(包括中断上传留下的临时文件)，返回删除的文件数"""
+        now = time.time()
+        removed = 0
+        with self._lock:
+            for entry in self._list():
+                if now - entry.stat().st_mtime > self.ttl and self._remove(entry):
+                    removed += 1
+        return removed + self.enforce_quota()
+
+    def enforce_quota(self) -> int:
+        """总大小超过配额时按最近访问时间淘汰旧文件，返回删除的文件数"""
+        removed = 0
+        with self._lock:
+            entries = sorted(self._list(), key=lambda entry: entry.stat().st_mtime)
+            total = sum(entry.stat().st_size for entry in entries)
+            for entry in entries:
+                if total <= self.max_bytes:
+                    break
+                size = entry.stat().st_size
+                if self._remove(entry):
+                    total -= size
+                    removed += 1
+        if removed:
+            print(f"临时文件超出配额，已淘汰{removed}个文件")
+        return removed
+
+    def usage(self) -> Dict[str, int]:
+        entries = self._list()
+        return {"files": len(entries), "bytes": sum(entry.stat().st_size for entry in entries)}
+
+    async def _sweep_loop(self) -> None:
+        while True:
+            try:
+                removed = await run_blocking("csv", Config.CSV_IO_MAX_WORKERS, self.sweep)
+                if removed:
+                    print(f"已清理{removed}个临时文件")
+            except Exception as e:
+                print(f"清理临时文件失败: {str(e)}")
+            await asyncio.sleep(self.sweep_interval)
+
+    def start(self) -> None:
+        """启动后台清理任务"""
+        if self._sweeper is None:
+            self._sweeper = asyncio.get_running_loop().create_task(self._sweep_loop())
+
+    async def stop(self) -> None:
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            self._sweeper = None
+
+
+_store: Optional[ArtifactStore] = None
+
+
+def get_artifact_store() -> ArtifactStore:
+    """获取全局共享的临时文件存储"""
+    global _store
+    if _store is None:
+        _store = ArtifactStore(
+            Config.ARTIFACT_DIR,
+            ttl=Config.ARTIFACT_TTL,
+            max_bytes=Config.ARTIFACT_MAX_BYTES,
+            sweep_interval=Config.ARTIFACT_SWEEP_INTERVAL
+        )
+    return _store
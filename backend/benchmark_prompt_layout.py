@@ -0,0 +1,81 @@
+"""
+对比两种prompt布局的首token延迟(近似prefill耗时)
+需要本地推理服务(LM Studio / llama.cpp server)，地址见config.py，例如：
+    IPADDR=127.0.0.1 python benchmark_prompt_layout.py
+模拟一段逐轮增长的对话，每轮分别用single和chat布局请求，拿到第一个token后立即断开
+"""
+
+import asyncio
+import time
+from typing import List, Tuple
+
+from config import Config
+from llm import LLMService
+from prompt_builder import PromptBuilder
+
+TURNS = 12
+
+QUESTIONS = [
+    "今天好累啊", "晚饭吃什么好呢", "推荐一部电影吧", "我明天要去面试",
+    "有点紧张怎么办", "你喜欢下雨天吗", "周末想去爬山", "帮我想个生日礼物",
+    "我养了一只猫", "最近在学吉他", "早点睡觉吧", "晚安",
+]
+
+
+def load_builders() -> Tuple[PromptBuilder, PromptBuilder]:
+    with open('./prompts/reply.txt', 'r', encoding='utf-8') as file:
+        template = file.read()
+    with open('./prompts/reply_turn.txt', 'r', encoding='utf-8') as file:
+        turn_template = file.read()
+    single = PromptBuilder(template)
+    chat = PromptBuilder(template, layout="chat", turn_template=turn_template)
+    return single, chat
+
+
+async def time_to_first_token(llm_service: LLMService, prompt) -> float:
+    started = time.perf_counter()
+    stream = llm_service.stream_response(prompt, max_retries=1)
+    try:
+        async for _ in stream:
+            break
+    finally:
+        await stream.aclose()
+    return (time.perf_counter() - started) * 1000
+
+
+async def run_layout(llm_service: LLMService, builder: PromptBuilder, name: str) -> List[float]:
+    history: List[Tuple[str, str]] = []
+    user_info = "用户喜欢猫，生日是三月。"
+    costs = []
+    for turn, question in enumerate(QUESTIONS[:TURNS]):
+        prompt, report = builder.build(history, question, "无补充信息", user_info)
+        cost = await time_to_first_token(llm_service, prompt)
+        costs.append(cost)
+        print(f"[{name}] 第{turn + 1}轮 prompt {report['total']} tokens, 首token {cost:.0f}ms")
+        # 固定的回复内容，保证两种布局的历史完全一致
+        history.append((question, f"好的呀，小可记住啦，第{turn + 1}轮~"))
+    return costs
+
+
+async def main():
+    llm_service = LLMService(Config.LLM_API_KEY, Config.LLM_API_URL)
+    await LLMService.startup([Config.LLM_API_URL])
+    try:
+        single, chat = load_builders()
+        # 两种布局各跑一遍，先跑一轮预热避免模型加载时间影响结果
+        await time_to_first_token(llm_service, "你好")
+        single_costs = await run_layout(llm_service, single, "single")
+        chat_costs = await run_layout(llm_service, chat, "chat")
+        
+        # 第一轮两种布局都没有可复用的前缀，只比较之后的轮次
+        single_avg = sum(single_costs[1:]) / max(1, len(single_costs) - 1)
+        chat_avg = sum(chat_costs[1:]) / max(1, len(chat_costs) - 1)
+        print(f"\n平均首token延迟(第2轮起): single {single_avg:.0f}ms, chat {chat_avg:.0f}ms")
+        if single_avg:
+            print(f"chat布局节省: {single_avg - chat_avg:.0f}ms ({(single_avg - chat_avg) / single_avg:.0%})")
+    finally:
+        await LLMService.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,9 +1,9 @@
-from typing import Optional, Tuple
+from typing import Optional, Tuple, AsyncIterator, Dict, Any
+import asyncio
 from llm import LLMService
-from tts import TTSService
+from tts import TTSService, SentenceSplitter
 from config import Config
-from main_agent import MainAgent
-from conversation import ConversationHistory
+from session_manager import SessionManager
 
 class ChatService:
     def __init__(self):
@@ -13,9 +13,8 @@ class ChatService:
         # 只在启用TTS时初始化TTS服务
         self.tts_service = TTSService(Config.FISH_API_KEY, Config.FISH_REFERENCE_ID) if Config.is_tts_enabled() else None
          
-        # 初始化对话历史和主Agent
-        self.conversation_history = ConversationHistory(max_turns=Config.MAX_TURNS)
-        self.main_agent = MainAgent(self.llm_service, self.conversation_history)
+        # 每个会话有独立的对话历史和主Agent
+        self.session_manager = SessionManager(self.llm_service)
 
     async def generate_reply(self, message: str, session_id: str) -> Tuple[str, Optional[bytes], str]:
         """
@@ -25,14 +24,16 @@ class ChatService:
         :return: (回复文本, 语音数据, 表情)
         """
         try:
-            # 使用 MainAgent 生成回复和表情
-            reply, expression = await self.main_agent.reply(message)
+            # 使用会话自己的 MainAgent 生成回复和表情
+            session = self.session_manager.get(session_id)
+            async with session.lock:
+                reply, expression = await session.main_agent.reply(message)
             
             # 生成语音 (如果TTS服务已启用)
             audio_data = None   
             if reply and self.tts_service:
                 try:
-                    audio_data = self.tts_service.generate_audio(reply)
+                    audio_data = await self.tts_service.generate_audio_async(reply)
                 except Exception as e:
                     print(f"生成语音时出错了喵: {e}")
             
@@ -41,3 +42,123 @@ class ChatService:
         except Exception as e:
             print(f"生成回复时出错了喵: {e}")
             return "对不起，我现在有点累了，能稍后再聊吗？", None, "生气"
+
+    async def stream_reply(self, message: str, session_id: str) -> AsyncIterator[Dict[str, Any]]:
+        """
+        流式生成回复
+        :param message: 用户消息
+        :param session_id: 会话ID
+        :return: 依次产出文本增量事件，最后产出带表情、用户信息和语音的done事件
+        """
+        try:
+            session = self.session_manager.get(session_id)
+            async with session.lock:
+                events = session.main_agent.reply_stream(message)
+                if self.tts_service and Config.TTS_PIPELINE_ENABLED:
+                    events = self._pipeline_tts(events)
+                
+                async for event in events:
+                    if event["type"] == "done" and "audio" not in event:
+                        event["audio"] = None
+                        if event["message"] and self.tts_service:
+                            try:
+                                event["audio"] = await self.tts_service.generate_audio_async(event["message"])
+                            except Exception as e:
+                                print(f"生成语音时出错了喵: {e}")
+                    yield event
+                
+        except Exception as e:
+            print(f"生成回复时出错了喵: {e}")
+            yield {
+                "type": "done",
+                "message": "对不起，我现在有点累了，能稍后再聊吗？",
+                "expression": "生气",
+                "user_info": None,
+                "audio": None
+            }
+
+    async def _pipeline_tts(self, events: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[Dict[str, Any]]:
+        """
+        边生成边合成语音
+        文本增量按句切分后并发合成(受TTS_MAX_CONCURRENCY限制)，
+        合成好的语音按句子顺序以 {"type": "audio", "index", "text", "audio"} 事件推送
+        """
+        output = asyncio.Queue()
+        pending_tts = asyncio.Queue()  # 按句子顺序排列的合成任务，None表示没有更多句子
+        semaphore = asyncio.Semaphore(Config.TTS_MAX_CONCURRENCY)
+        splitter = SentenceSplitter(min_length=Config.TTS_MIN_SENTENCE_LENGTH)
+        tts_tasks = []
+        
+        async def synthesize(sentence: str) -> bytes:
+            async with semaphore:
+                return await self.tts_service.generate_audio_async(sentence)
+        
+        def schedule(sentence: str) -> None:
+            task = asyncio.create_task(synthesize(sentence))
+            tts_tasks.append(task)
+            pending_tts.put_nowait((sentence, task))
+        
+        async def produce_text() -> Dict[str, Any]:
+            done_event = None
+            try:
+                async for event in events:
+                    if event["type"] == "delta":
+                        for sentence in splitter.feed(event["content"]):
+                            schedule(sentence)
+                        await output.put(event)
+                    elif event["type"] == "done":
+                        rest = splitter.flush()
+                        if rest:
+                            schedule(rest)
+                        # 没有流式文本(例如出错后的兜底回复)时整句合成
+                        if not tts_tasks and event["message"]:
+                            schedule(event["message"])
+                        done_event = event
+                    else:
+                        await output.put(event)
+            finally:
+                pending_tts.put_nowait(None)
+            return done_event
+        
+        async def send_audio() -> int:
+            index = 0
+            while True:
+                item = await pending_tts.get()
+                if item is None:
+                    return index
+                sentence, task = item
+                try:
+                    audio_data = await task
+                except Exception as e:
+                    print(f"生成语音时出错了喵: {e}")
+                    audio_data = b""
+                if audio_data:
+                    await output.put({
+                        "type": "audio",
+                        "index": index,
+                        "text": sentence,
+                        "audio": audio_data
+                    })
+                    index += 1
+        
+        producer = asyncio.create_task(produce_text())
+        sender = asyncio.create_task(send_audio())
+        workers = asyncio.gather(producer, sender)
+        workers.add_done_callback(lambda _: output.put_nowait(None))
+        try:
+            while True:
+                event = await output.get()
+                if event is None:
+                    break
+                yield event
+            
+            done_event, audio_count = await workers
+            if done_event:
+                done_event["audio"] = None
+                done_event["audio_chunks"] = audio_count
+                yield done_event
+        finally:
+            # 客户端断开时取消尚未完成的任务
+            for task in [producer, sender, *tts_tasks]:
+                if not task.done():
+                    task.cancel()
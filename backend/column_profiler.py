@@ -0,0 +1,92 @@
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+
+
+class ColumnProfile:
+    """
+    数据表的列画像：一次遍历每列，推断类型并计算空值数、基数、常见值和数值统计
+    数值列只保存转换后的数值Series，不复制整个DataFrame
+    df为大文件的抽样时传入全表精确的null_counts和row_count，空值数按全表报告，基数和常见值注明来自抽样
+    """
+    def __init__(
+        self,
+        df: pd.DataFrame,
+        top_n: int = 5,
+        null_counts: Optional[pd.Series] = None,
+        row_count: Optional[int] = None
+    ):
+        self.sampled = null_counts is not None
+        self.row_count = row_count if row_count is not None else len(df)
+        self.columns: List[str] = df.columns.tolist()
+        self.numeric: Dict[str, pd.Series] = {}  # 数值列 -> 转换后的数值
+        self.profiles: Dict[str, Dict[str, Any]] = {}
+        
+        for col in self.columns:
+            self.profiles[col] = self._profile_column(col, df[col], top_n)
+            if self.sampled:
+                self.profiles[col]["null_count"] = int(null_counts[col])
+
+    def _profile_column(self, col: str, series: pd.Series, top_n: int) -> Dict[str, Any]:
+        null_count = int(series.isna().sum())
+        profile = {
+            "dtype": str(series.dtype),
+            "null_count": null_count,
+            "unique": int(series.nunique(dropna=True))
+        }
+        
+        numeric = self._to_numeric(series, null_count)
+        if numeric is not None:
+            self.numeric[col] = numeric
+            profile["type"] = "numeric"
+            profile["stats"] = {
+                key: float(value) for key, value in numeric.describe().items()
+            }
+        else:
+            profile["type"] = "category"
+            counts = series.value_counts(dropna=True).head(top_n)
+            profile["top_values"] = [
+                {"value": str(value), "count": int(count)} for value, count in counts.items()
+            ]
+        return profile
+
+    @staticmethod
+    def _to_numeric(series: pd.Series, null_count: int):
+        """列中所有非空值都能解析为数值时返回数值Series，否则返回None"""
+        if pd.api.types.is_bool_dtype(series):
+            return None
+        if pd.api.types.is_numeric_dtype(series):
+            return series
+        numeric = pd.to_numeric(series, errors="coerce")
+        if int(numeric.isna().sum()) != null_count or null_count == len(series):
+            return None
+        return numeric
+
+    @property
+    def numeric_columns(self) -> List[str]:
+        return [col for col in self.columns if col in self.numeric]
+
+    @property
+    def category_columns(self) -> List[str]:
+        return [col for col in self.columns if col not in self.numeric]
+
+    def stats_text(self) -> str:
+        """与DataFrame.describe()格式一致的数值统计表"""
+        stats = {col: self.profiles[col]["stats"] for col in self.numeric_columns}
+        if not stats:
+            return "无数值列"
+        return pd.DataFrame(stats).to_string()
+
+    def column_info_text(self) -> str:
+        """每列的类型、空值数、基数和常见值"""
+        lines = []
+        if self.sampled:
+            lines.append(f"(共{self.row_count}行，空值数为全表统计，不同值和常见值来自抽样)")
+        for col in self.columns:
+            profile = self.profiles[col]
+            line = f"{col}: {profile['type']}({profile['dtype']}), 空值{profile['null_count']}个, 不同值{profile['unique']}个"
+            if profile.get("top_values"):
+                top = ", ".join(f"{item['value']}({item['count']})" for item in profile["top_values"])
+                line += f", 常见值: {top}"
+            lines.append(line)
+        return "\n".join(lines)
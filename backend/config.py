@@ -6,12 +6,36 @@ class Config:
     ''' LLM配置 '''
     LLM_API_URL = f"http://{IPADDR}:1234/v1/chat/completions"
     LLM_API_KEY = "lm-studio"
+    LLM_MODEL = "claude-3-5-sonnet-20240620"
+    LLM_TIMEOUT = 120.0  # 单次请求超时时间(秒)
+    LLM_POOL_TIMEOUT = 30.0  # 等待连接池空闲连接的超时时间(秒)
+    LLM_MAX_CONNECTIONS_PER_HOST = 8  # 每个LLM服务地址最多同时占用的连接数
+    LLM_MAX_KEEPALIVE_CONNECTIONS = 8  # 连接池中保持活跃的空闲连接数
+    LLM_KEEPALIVE_EXPIRY = 60.0  # 空闲连接保活时间(秒)
+    LLM_MAX_IN_FLIGHT = 4  # 同时发往同一LLM服务的请求数上限
+    LLM_RESERVED_INTERACTIVE = 1  # 只留给对话请求的名额，后台任务(CSV填写、数据分析)最多使用其余名额
+    LLM_MAX_WAITING = 64  # 等待名额的请求数上限，超出时直接失败
+    LLM_ADMISSION_TIMEOUT = {"interactive": 30, "background": 600}  # 各优先级等待名额的最长时间(秒)
+    LLM_CACHE_ENABLED = True  # 缓存调用方选择缓存的LLM回复
+    LLM_CACHE_ALL_TEMPERATURES = False  # 默认只缓存temperature为0的确定性调用
+    LLM_CACHE_PATH = "./save/llm_cache.db"
+    LLM_CACHE_MEMORY_SIZE = 256  # 内存中保留的回复条数
+    LLM_CACHE_MAX_ENTRIES = 10000  # 磁盘缓存条目上限，超出后淘汰最久未访问的
+    LLM_CACHE_PROMPT = False  # 请求中带上cache_prompt参数(llama.cpp server)，让服务端复用上一轮的KV缓存
     
     ''' 向量模型配置 '''
     EMBEDDING_API_KEY = "lm-studio"
     EMBEDDING_API_URL = f"http://{IPADDR}:1234/v1/embeddings"
     EMBEDDING_MODEL = "text-embedding-nomic-embed-text-v1.5"
     EMBEDDING_DIMENSION = 768
+    EMBEDDING_BATCH_SIZE = 32  # 批量embedding每次请求最多包含的文本数
+    EMBEDDING_BATCH_MAX_TOKENS = 8192  # 批量embedding每次请求的估算token上限
+    EMBEDDING_CACHE_ENABLED = True  # 缓存embedding结果，相同的文本不再重复请求
+    EMBEDDING_CACHE_PATH = "./save/embedding_cache.db"
+    EMBEDDING_CACHE_MEMORY_SIZE = 2048  # 内存LRU缓存的条目数
+    EMBEDDING_CACHE_MAX_ENTRIES = 200000  # 磁盘缓存的条目数上限
+    CACHE_IO_MAX_WORKERS = 2  # 异步调用中读写SQLite缓存的线程数上限
+    MEMORY_MAX_WORKERS = 4  # 运行向量数据库读写的线程数上限
     
     ''' 
         TTS服务配置
@@ -21,9 +45,82 @@ class Config:
     '''
     FISH_API_KEY = ""
     FISH_REFERENCE_ID = "de00397ed7f6477a8763a0d436ece815" #芙宁娜
+    TTS_PIPELINE_ENABLED = True  # 流式聊天时按句合成语音，边生成边播放
+    TTS_MAX_CONCURRENCY = 3  # 同时合成的句子数上限
+    TTS_MAX_WORKERS = 4  # 运行同步Fish SDK的线程数上限
+    TTS_MIN_SENTENCE_LENGTH = 6  # 短于该长度的句子会和下一句合并后再合成
     
     ''' 对话历史配置 '''
     MAX_TURNS = 20  # 最多保存20轮对话，超过后自动归档一半
+    # prompt布局："single"把所有内容放进一条消息(reply.txt)；
+    # "chat"把人设放在固定的system消息、历史按轮追加(由reply.txt生成 + reply_turn.txt)，便于本地模型复用前缀缓存
+    PROMPT_LAYOUT = "single"
+    PROMPT_MAX_TOKENS = 6000  # 回复prompt的token上限，超出时裁剪对话记录、记忆和用户信息
+    PROMPT_MIN_HISTORY_TURNS = 4  # 裁剪记忆和用户信息之前至少保留的最近对话轮数
+    MEMORY_CHUNK_WINDOW = 1  # 每个记忆chunk包含的轮数(当前轮及之前的轮次)
+    MEMORY_TOP_K = 4  # 检索时取最相关的chunk数
+    MEMORY_NEIGHBOR_TURNS = 1  # 命中轮次两侧各合并的相邻轮数
+    MEMORY_MAX_TOKENS = 600  # 注入prompt的记忆token上限
+    ARCHIVE_QUEUE_PATH = "./save/archive_queue.db"  # 归档任务持久化文件，重启后继续归档
+    ARCHIVE_BATCH_SIZE = 16  # 后台worker每批处理的归档任务数
+    ARCHIVE_POLL_INTERVAL = 5.0  # 没有新任务时检查重试任务的间隔(秒)
+    ARCHIVE_RETRY_DELAY = 2.0  # 归档失败后的首次重试延迟(秒)，之后指数增长
+    ARCHIVE_MAX_RETRY_DELAY = 300.0  # 归档重试延迟上限(秒)
+    
+    ''' 重试与熔断配置 '''
+    RETRY_BASE_DELAY = 0.5  # 指数退避的初始等待时间(秒)，实际等待时间在0到该值的2^n倍之间随机
+    RETRY_MAX_DELAY = 8.0  # 单次重试等待时间上限(秒)
+    CIRCUIT_FAILURE_THRESHOLD = 5  # 同一后端连续失败该次数后熔断
+    CIRCUIT_RESET_TIMEOUT = 30  # 熔断后经过该时间(秒)放行一个探测请求
+    LLM_REQUEST_DEADLINE = 300  # 一次LLM调用(含所有重试)的最长时间(秒)
+    EMBEDDING_REQUEST_DEADLINE = 60  # 一次embedding调用(含所有重试)的最长时间(秒)
+    TTS_REQUEST_DEADLINE = 60  # 一次语音合成(含所有重试)的最长时间(秒)
+    
+    ''' 会话配置 '''
+    SESSION_IDLE_TIMEOUT = 1800  # 会话空闲超过该时间(秒)后回收
+    SESSION_MAX_COUNT = 200  # 内存中最多保留的会话数
+    SESSION_SWEEP_INTERVAL = 60  # 检查空闲会话的间隔(秒)
+    
+    ''' 后台任务配置 '''
+    JOB_MAX_WORKERS = 4  # 后台任务worker数
+    JOB_BACKEND_LIMITS = {"llm": 2}  # 每个后端同时运行的任务数上限
+    JOB_MAX_PENDING = 100  # 排队任务数上限，超出时拒绝提交
+    JOB_RESULT_TTL = 3600  # 已结束任务保留时间(秒)
+    JOB_EVENT_INTERVAL = 15  # 任务事件流无变化时发送心跳的间隔(秒)
+    
+    ''' 临时文件配置 '''
+    ARTIFACT_DIR = "temp"  # 上传文件和填写结果的存放目录
+    ARTIFACT_TTL = 24 * 3600  # 文件超过该时间(秒)未访问后删除
+    ARTIFACT_MAX_BYTES = 1024 * 1024 * 1024  # 临时文件总大小上限，超出时淘汰最久未访问的文件
+    ARTIFACT_SWEEP_INTERVAL = 600  # 清理过期文件的间隔(秒)
+    ARTIFACT_BLOCK_SIZE = 1024 * 1024  # 保存上传文件时每次读写的字节数
+    
+    ''' CSV填写配置 '''
+    CSV_STREAMING_MIN_BYTES = 50 * 1024 * 1024  # 超过该大小的文件分块流式读取，不整表载入内存
+    CSV_READ_CHUNK_ROWS = 50000  # 流式读取时每块的行数
+    CSV_SAMPLE_ROWS = 10000  # 流式读取时保留的随机样本行数(用于分位数和可视化)
+    CSV_IO_MAX_WORKERS = 2  # 读写大文件的线程数上限
+    CSV_STREAM_CHUNK_BYTES = 64 * 1024  # 流式转换CSV时每次读取和输出的字节数
+    CSV_ROW_COLUMN = "__row__"  # 分批填写时标记原始行号的列名
+    CSV_CHUNK_MIN_ROWS = 100  # 超过该行数时自动使用分批填写
+    CSV_BATCH_MAX_ROWS = 50  # 每批最多包含的待填写行数
+    CSV_BATCH_MAX_TOKENS = 2000  # 每批待填写数据的估算token上限
+    CSV_CONTEXT_ROWS = 5  # 每批附带的完整数据样本行数
+    CSV_MAX_CONCURRENCY = 4  # 同时处理的批次数
+    CSV_REJECTED_REPORT_LIMIT = 100  # 返回结果中最多列出的未通过校验(或本地预填写)的单元格数
+    CSV_PREFILL_ENABLED = True  # 调用模型前先用本地规则填写高置信度的空白单元格
+    CSV_PREFILL_MIN_CONFIDENCE = 0.85  # 本地规则结果的置信度不低于该值时直接填写
+    CSV_FILL_TEMPERATURE = 0  # 填写单元格时的temperature，为0时回复可被缓存
+    CSV_BATCH_RETRIES = 2  # 单批返回格式不正确时的重试次数
+    
+    ''' 数据分析配置 '''
+    ANALYSIS_CACHE_ENABLED = True  # 缓存相同文件、相同要求的分析结果
+    ANALYSIS_CACHE_PATH = "./save/analysis_cache.db"
+    ANALYSIS_CACHE_TTL = 7 * 24 * 3600  # 分析结果缓存有效期(秒)
+    ANALYSIS_CACHE_MEMORY_SIZE = 16  # 内存中保留的分析结果条数
+    ANALYSIS_CACHE_MAX_ENTRIES = 500  # 分析结果缓存条目数上限
+    VIZ_MAX_CATEGORIES = 20  # 图表分类数上限，超出部分合并为"其他"
+    VIZ_MAX_POINTS = 500  # 折线图降采样后的点数上限
     
     @classmethod
     def is_tts_enabled(cls) -> bool:
@@ -1,11 +1,15 @@
-from typing import List
+from typing import List, Optional
+import hashlib
 import chromadb
 from chromadb.config import Settings
 from chromadb.api.types import EmbeddingFunction
 from datetime import datetime
-import uuid
+import asyncio
 from embedding import EmbeddingService
 from config import Config
+from executors import run_blocking
+from archive_queue import get_archive_queue
+from memory_index import MemoryIndexer
 
 class APIEmbeddingFunction(EmbeddingFunction):
     def __init__(self):
@@ -17,96 +21,132 @@ class APIEmbeddingFunction(EmbeddingFunction):
         )
         
     def __call__(self, texts: List[str]) -> List[List[float]]:
-        embeddings = []
-        for text in texts:
-            try:
-                embedding = self.embedding_service.get_embedding(text)
-                if embedding is None:
-                    embedding = [0.0] * Config.EMBEDDING_DIMENSION
-                embeddings.append(embedding)
-            except Exception as e:
-                print(f"获取embedding时出错喵: {e}")
-                embedding = [0.0] * Config.EMBEDDING_DIMENSION
-                embeddings.append(embedding)
-        return embeddings
+        try:
+            embeddings = self.embedding_service.get_embeddings(texts)
+        except Exception as e:
+            print(f"获取embedding时出错喵: {e}")
+            embeddings = [None] * len(texts)
+        return [
+            embedding if embedding is not None else [0.0] * Config.EMBEDDING_DIMENSION
+            for embedding in embeddings
+        ]
 
 
 class ConversationTurn:
     def __init__(self, ask: str, answer: str):
         self.ask = ask
         self.answer = answer
+        self.timestamp = datetime.now().isoformat()
+
+    def to_dict(self) -> dict:
+        return {"ask": self.ask, "answer": self.answer, "timestamp": self.timestamp}
 
     def __str__(self):
         return f"user: {self.ask}\nassistant: {self.answer}"
 
 
+_chroma_client = None
+
+
+def get_chroma_client():
+    """所有会话共享同一个向量数据库客户端"""
+    global _chroma_client
+    if _chroma_client is None:
+        _chroma_client = chromadb.Client(Settings(
+            persist_directory="./save/memory",
+            is_persistent=True
+        ))
+    return _chroma_client
+
+
+def memory_collection_name(session_id: Optional[str]) -> str:
+    """每个会话使用独立的记忆集合，默认会话沿用原来的memory集合"""
+    if not session_id or session_id == "default":
+        return "memory"
+    digest = hashlib.sha1(session_id.encode('utf-8')).hexdigest()[:16]
+    return f"memory_{digest}"
+
+
 class ConversationHistory:
-    def __init__(self, max_turns: int = 20):
+    def __init__(self, max_turns: int = 20, session_id: Optional[str] = None):
         self.turns = []
         self.max_turns = max_turns
+        self.session_id = session_id or "default"
 
         # 初始化向量数据库客户端
-        self.client = chromadb.Client(Settings(
-            persist_directory="./save/memory",
-            is_persistent=True
-        ))
+        self.client = get_chroma_client()
         
         # 获取或创建集合
+        self.embedding_function = APIEmbeddingFunction()
         self.collection = self.client.get_or_create_collection(
-            name="memory",
-            embedding_function=APIEmbeddingFunction()
+            name=memory_collection_name(self.session_id),
+            embedding_function=self.embedding_function
         )
+        self.indexer = MemoryIndexer()
         
-    def add_dialog(self, user_message: str, assistant_message: str):
+    def add_dialog(self, user_message: str, assistant_message: str, auto_archive: bool = True):
         """添加新对话，并在需要时触发自动归档"""
         turn = ConversationTurn(user_message, assistant_message)
         self.turns.append(turn)
         
         # 当对话数量达到最大值时，自动归档一半的对话
-        if len(self.turns) >= self.max_turns:
+        if auto_archive and len(self.turns) >= self.max_turns:
             self._auto_archive()
             
     def _auto_archive(self):
-        """自动归档一半的对话"""
-        if not self.turns:
-            return
+        """自动归档一半的对话，写入由后台归档队列完成"""
+        self.queue_archive(self.take_archive_batch())
+
+    def take_archive_batch(self) -> List[ConversationTurn]:
+        """
+        对话数达到上限时，从缓冲区取出最早的一半对话并返回，否则返回空列表
+        只修改内存中的缓冲区，写入向量数据库由后台归档队列完成
+        """
+        if not self.turns or len(self.turns) < self.max_turns:
+            return []
             
         # 计算要归档的对话数量
         archive_count = len(self.turns) // 2
-        
-        # 准备归档内容
         archive_turns = self.turns[:archive_count]
-        content = "\n".join(str(turn) for turn in archive_turns)
-        
-        print("以下内容将被归档：")
-        print(content)
-        print("--------------------------------")
-        
-        # 保存到向量数据库
-        self.collection.add(
-            documents=[content],
-            metadatas=[{
-                "timestamp": datetime.now().isoformat()
-            }],
-            ids=[str(uuid.uuid4())]
-        )
         
         # 移除已归档的对话
         self.turns = self.turns[archive_count:]
+        return archive_turns
+
+    def archive_all(self):
+        """归档全部对话，会话被回收前调用，避免丢失缓冲区中的对话"""
+        archive_turns, self.turns = self.turns, []
+        self.queue_archive(archive_turns)
+
+    def queue_archive(self, archive_turns: List[ConversationTurn]):
+        """把对话放入后台归档队列，立即返回"""
+        if not archive_turns:
+            return
+        get_archive_queue().submit(self.session_id, [turn.to_dict() for turn in archive_turns])
         
     def get_context(self) -> str:
         """获取格式化后的对话上下文"""
         return "\n".join(str(turn) for turn in self.turns)
         
-    def retrieve(self, user_message: str, n_results: int = 3) -> List[str]:
-        """获取与用户消息最相关的历史记忆"""
-        results = self.collection.query(
-            query_texts=[user_message],
-            n_results=n_results,
-            include=['documents']
-        )
+    def retrieve(self, user_message: str) -> List[str]:
+        """获取与用户消息最相关的历史记忆(已合并相邻轮次并按token预算截断)"""
+        embedding = self.embedding_function([user_message])[0]
+        return self.indexer.retrieve(self.collection, embedding, self.session_id)
+
+    async def aretrieve(self, user_message: str) -> List[str]:
+        """retrieve的异步版本：异步获取embedding，向量查询放到有界线程池中执行"""
+        embedding = await self.embedding_function.embedding_service.aget_embedding(user_message)
+        if embedding is None:
+            embedding = [0.0] * Config.EMBEDDING_DIMENSION
         
-        return results['documents'][0] if results['documents'] else []
+        return await run_blocking(
+            "memory",
+            Config.MEMORY_MAX_WORKERS,
+            self.indexer.retrieve,
+            self.collection,
+            embedding,
+            self.session_id
+        )
 
 
 if __name__ == "__main__":
@@ -119,7 +159,7 @@ if __name__ == "__main__":
         #await conversation_history.archive(1, 1, "电影推荐")
         #await conversation_history.archive(0, 0, "广州有什么好吃的")
         
-        memories = conversation_history.retrieve("广州美食", n_results=1)
+        memories = conversation_history.retrieve("广州美食")
         print("--------------------------------")
         print(memories)
 
@@ -0,0 +1,198 @@
+import os
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from config import Config
+
+
+class CSVScan:
+    """流式扫描CSV得到的统计信息和样本，内存占用与文件大小无关"""
+    def __init__(self, columns: List[str]):
+        self.columns = columns
+        self.row_count = 0
+        self.null_counts = pd.Series(0, index=columns, dtype="int64")
+        self.numeric_columns: List[str] = list(columns)  # 在所有分块中都能解析为数值的列
+        self.integer_columns: List[str] = list(columns)  # 数值列中所有值都是整数的列
+        self.head: Optional[pd.DataFrame] = None  # 前几行，用作提示词中的数据样本
+        self.complete_rows: Optional[pd.DataFrame] = None  # 前几行没有空白的完整数据
+        self.sample: Optional[pd.DataFrame] = None  # 均匀随机抽样，用于分位数和可视化
+        self.blank_rows_path: Optional[str] = None  # 含空白单元格的行(带原始行号)溢写到的文件
+        self.blank_row_count = 0
+        self._sums: Dict[str, float] = {}
+        self._squares: Dict[str, float] = {}
+        self._counts: Dict[str, int] = {}
+        self._mins: Dict[str, float] = {}
+        self._maxs: Dict[str, float] = {}
+
+    @property
+    def has_blanks(self) -> bool:
+        return bool(self.null_counts.any())
+
+    def dtypes(self) -> Dict[str, str]:
+        """
+        整个文件统一的列类型，供再次分块读取时使用，避免各分块各自推断：
+        整数列为可空的Int64(含空白也不会变成25.0)，其余数值列为float64，其它列保持原文
+        """
+        dtypes = {}
+        for col in self.columns:
+            if col in self.integer_columns:
+                dtypes[col] = "Int64"
+            elif col in self.numeric_columns:
+                dtypes[col] = "float64"
+            else:
+                dtypes[col] = "object"
+        return dtypes
+
+    def describe(self) -> pd.DataFrame:
+        """与DataFrame.describe()格式一致的数值统计；均值、标准差、极值精确，分位数来自抽样"""
+        stats = {}
+        for col in self.numeric_columns:
+            count = self._counts.get(col, 0)
+            if not count:
+                continue
+            mean = self._sums[col] / count
+            variance = (self._squares[col] - count * mean * mean) / (count - 1) if count > 1 else float("nan")
+            sample = pd.to_numeric(self.sample[col], errors="coerce") if self.sample is not None else pd.Series(dtype=float)
+            stats[col] = {
+                "count": float(count),
+                "mean": mean,
+                "std": float(np.sqrt(max(variance, 0.0))) if count > 1 else float("nan"),
+                "min": self._mins[col],
+                "25%": sample.quantile(0.25),
+                "50%": sample.quantile(0.5),
+                "75%": sample.quantile(0.75),
+                "max": self._maxs[col]
+            }
+        return pd.DataFrame(stats)
+
+    def _update_numeric(self, chunk: pd.DataFrame) -> None:
+        for col in list(self.numeric_columns):
+            values = chunk[col]
+            if not pd.api.types.is_numeric_dtype(values) or pd.api.types.is_bool_dtype(values):
+                # 布尔值与DataFrame.describe()一致，不作为数值
+                is_bool = pd.api.types.infer_dtype(values, skipna=True) in ("boolean", "mixed")
+                values = pd.to_numeric(values, errors="coerce")
+                # 分块中出现无法解析为数值的非空值，该列不再视为数值列
+                if is_bool or values.isna().sum() > chunk[col].isna().sum():
+                    self.numeric_columns.remove(col)
+                    if col in self.integer_columns:
+                        self.integer_columns.remove(col)
+                    continue
+            values = values.dropna()
+            if values.empty:
+                continue
+            if col in self.integer_columns and not (values % 1 == 0).all():
+                self.integer_columns.remove(col)
+            self._counts[col] = self._counts.get(col, 0) + len(values)
+            self._sums[col] = self._sums.get(col, 0.0) + float(values.sum())
+            self._squares[col] = self._squares.get(col, 0.0) + float((values.astype("float64") ** 2).sum())
+            self._mins[col] = min(self._mins.get(col, float("inf")), float(values.min()))
+            self._maxs[col] = max(self._maxs.get(col, float("-inf")), float(values.max()))
+
+
+def should_stream(file_path: str) -> bool:
+    """文件超过CSV_STREAMING_MIN_BYTES时使用流式处理"""
+    return os.path.getsize(file_path) >= Config.CSV_STREAMING_MIN_BYTES
+
+
+def iter_csv(file_path: str, chunksize: int = Config.CSV_READ_CHUNK_ROWS, dtype: Optional[Dict[str, str]] = None):
+    """分块读取CSV，块的索引在整个文件中连续；不给dtype时每个分块各自推断列类型"""
+    return pd.read_csv(file_path, chunksize=chunksize, dtype=dtype)
+
+
+def scan_csv(
+    file_path: str,
+    spill_path: Optional[str] = None,
+    head_rows: int = 5,
+    context_rows: int = Config.CSV_CONTEXT_ROWS,
+    sample_rows: int = Config.CSV_SAMPLE_ROWS,
+    seed: int = 0
+) -> CSVScan:
+    """
+    分块扫描CSV：增量统计行数、空值数、数值列统计，保留表头样本、完整行样本和均匀随机样本；
+    给出spill_path时把含空白的行(带原始行号)写到该文件，供分批填写使用；路径由调用方分配并负责删除
+    """
+    rng = np.random.default_rng(seed)
+    scan = None
+    sample_keys = None
+    
+    for chunk in iter_csv(file_path):
+        if scan is None:
+            scan = CSVScan(chunk.columns.tolist())
+            scan.head = chunk.head(head_rows)
+            scan.blank_rows_path = spill_path
+        
+        scan.row_count += len(chunk)
+        nulls = chunk.isna()
+        scan.null_counts += nulls.sum()
+        scan._update_numeric(chunk)
+        
+        blank_mask = nulls.any(axis=1)
+        if scan.complete_rows is None or len(scan.complete_rows) < context_rows:
+            complete = chunk[~blank_mask].head(context_rows)
+            scan.complete_rows = complete if scan.complete_rows is None else \
+                pd.concat([scan.complete_rows, complete]).head(context_rows)
+        
+        if spill_path and blank_mask.any():
+            blank = chunk[blank_mask]
+            blank.to_csv(
+                scan.blank_rows_path,
+                mode="a",
+                header=scan.blank_row_count == 0,
+                index=True,
+                index_label=Config.CSV_ROW_COLUMN
+            )
+            scan.blank_row_count += len(blank)
+        
+        # 给每行一个随机键，始终保留键最小的sample_rows行，相当于对全表均匀抽样
+        keys = pd.Series(rng.random(len(chunk)), index=chunk.index)
+        if scan.sample is not None:
+            keys = pd.concat([sample_keys, keys])
+        keep = keys.nsmallest(sample_rows).index
+        candidates = chunk if scan.sample is None else pd.concat([scan.sample, chunk])
+        scan.sample = candidates.loc[keep].sort_index()
+        sample_keys = keys.loc[scan.sample.index]
+    
+    if scan is None:
+        raise ValueError("CSV文件为空")
+    return scan
+
+
+def iter_blank_row_batches(scan: CSVScan, chunksize: int = Config.CSV_READ_CHUNK_ROWS):
+    """分块读回溢写的含空白行，索引为原始行号"""
+    if not scan.blank_rows_path or not scan.blank_row_count:
+        return
+    for chunk in pd.read_csv(scan.blank_rows_path, chunksize=chunksize, index_col=Config.CSV_ROW_COLUMN):
+        chunk.index.name = None
+        yield chunk
+
+
+def write_filled_csv(
+    file_path: str,
+    output_path: str,
+    cells: List[Dict[str, Any]],
+    apply_cells,
+    dtypes: Optional[Dict[str, str]] = None,
+    chunksize: int = Config.CSV_READ_CHUNK_ROWS
+) -> List[Dict[str, Any]]:
+    """
+    再次分块读取原文件，把填写结果应用到对应分块后追加写出
+    dtypes为scan_csv得到的列类型，所有分块按同样的类型读取，未填写的单元格原样写出
+    apply_cells返回该分块被拒绝的单元格，汇总后返回
+    """
+    # 分块大小固定，按行号直接算出单元格所在的分块
+    cells_by_chunk: Dict[int, List[Dict[str, Any]]] = {}
+    for cell in cells:
+        cells_by_chunk.setdefault(int(cell["row"]) // chunksize, []).append(cell)
+    
+    rejected = []
+    for number, chunk in enumerate(iter_csv(file_path, chunksize, dtypes)):
+        rejected.extend(apply_cells(chunk, cells_by_chunk.pop(number, [])))
+        chunk.to_csv(output_path, mode="w" if number == 0 else "a", header=number == 0, index=False)
+    
+    # 行号超出文件范围的单元格
+    for chunk_cells in cells_by_chunk.values():
+        rejected.extend({**cell, "reason": "行不存在"} for cell in chunk_cells)
+    return rejected
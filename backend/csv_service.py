@@ -1,11 +1,20 @@
 import pandas as pd
+import asyncio
+import csv
+import io
 import json
 import os
 import re
-from typing import Dict, List, Any, Optional
+from typing import Callable, Dict, List, Any, Optional
 
 from config import Config
+from artifact_store import get_artifact_store
+from csv_ingest import scan_csv, should_stream, iter_blank_row_batches, write_filled_csv
+from executors import run_blocking
+from fill_apply import apply_cells
+from prefill import PrefillEngine
 from llm import LLMService
+from tokens import count_tokens
 
 class CSVService:
     def __init__(self):
@@ -14,15 +23,31 @@ class CSVService:
             api_url=Config.LLM_API_URL
         )
         
-    async def process_csv(self, file_path: str, requirement: Optional[str] = None) -> Dict[str, Any]:
+    async def process_csv(
+        self,
+        file_path: str,
+        requirement: Optional[str] = None,
+        chunked: Optional[bool] = None,
+        progress: Optional[Callable[[int, int], None]] = None,
+        output_path: Optional[str] = None
+    ) -> Dict[str, Any]:
         """
         处理CSV文件，使用模型填写空白单元格
         
         参数:
         - file_path: CSV文件路径
         - requirement: 用户的填写要求（可选）
+        - chunked: 是否分批填写，默认行数超过CSV_CHUNK_MIN_ROWS时自动分批
+        - progress: 分批填写时每完成一批调用progress(已完成批数, 总批数)
+        - output_path: 结果保存路径，默认为原文件名加_filled后缀
+        
+        超过CSV_STREAMING_MIN_BYTES的大文件分块流式处理，不整表载入内存
+        启用CSV_PREFILL_ENABLED时先用本地规则填写高置信度的单元格，只把剩余空白交给模型
         """
         try:
+            if should_stream(file_path):
+                return await self._process_streaming(file_path, requirement, progress, output_path)
+            
             # 读取CSV文件
             df = pd.read_csv(file_path)
             
@@ -34,58 +59,57 @@ class CSVService:
                     "file_path": file_path  # 返回原文件路径，因为不需要处理
                 }
             
-            # 准备提示词
-            csv_content = df.fillna("[BLANK]").to_csv(index=False)
-            
-            # 从文件读取提示词模板
-            prompt_path = os.path.join(os.path.dirname(__file__), "prompts", "csv_handler.txt")
-            with open(prompt_path, "r", encoding="utf-8") as f:
-                prompt_template = f.read()
-            
-            # 构建提示词参数
-            prompt_params = {
-                "csv_content": csv_content,
-                "requirement": requirement if requirement else ""
-            }
-            
-            # 填充提示词
-            prompt = prompt_template.format(**prompt_params)
-            
-            print("发送提示词请求...")
-            if requirement:
-                print(f"用户填写要求: {requirement}")
+            prefilled = self._prefill(df) if Config.CSV_PREFILL_ENABLED else []
             
-            # 生成回复
-            response = await self.llm_service.generate_response(prompt, is_json=True)
+            if chunked is None:
+                chunked = len(df) > Config.CSV_CHUNK_MIN_ROWS
             
-            print("AI响应:", response)
-            
-            # 检查结果格式
-            if not isinstance(response, dict) or "cells" not in response:
-                return {
-                    "success": False,
-                    "message": "模型返回的格式不正确",
-                    "raw_response": str(response)
-                }
-            
-            # 根据模型回复填写DataFrame
-            for cell in response.get("cells", []):
-                row = int(cell["row"])  # 确保row是整数
-                column = cell["column"]
-                content = cell["content"]
+            if not df.isna().any().any():
+                # 全部由本地规则填写完成，无需调用模型
+                cells, failed_batches = [], 0
+            elif chunked:
+                blank_mask = df.isna().any(axis=1)
+                cells, failed_batches, total_batches = await self._fill_in_batches(
+                    df[blank_mask],
+                    df[~blank_mask].head(Config.CSV_CONTEXT_ROWS),
+                    requirement,
+                    progress
+                )
+                if failed_batches == total_batches and not prefilled:
+                    return {
+                        "success": False,
+                        "message": "模型返回的格式不正确"
+                    }
+            else:
+                response = await self._fill_whole(df, requirement)
                 
-                # 填写单元格
-                df.loc[row, column] = content
+                # 检查结果格式
+                if not isinstance(response, dict) or "cells" not in response:
+                    if not prefilled:
+                        return {
+                            "success": False,
+                            "message": "模型返回的格式不正确",
+                            "raw_response": str(response)
+                        }
+                    response = {"cells": []}
+                    failed_batches = 1
+                else:
+                    failed_batches = 0
+                cells = response.get("cells", [])
+            
+            # 根据模型回复填写DataFrame，按列校验类型后批量赋值
+            rejected = apply_cells(df, cells)
             
             # 保存处理后的CSV
-            output_path = os.path.splitext(file_path)[0] + "_filled.csv"
+            output_path = output_path or os.path.splitext(file_path)[0] + "_filled.csv"
             df.to_csv(output_path, index=False)
             
-            return {
-                "success": True,
-                "message": "CSV文件处理成功",
-                "file_path": output_path
-            }
+            result = self._result(output_path, failed_batches, rejected)
+            if prefilled:
+                result["message"] += f"，其中{len(prefilled)}个单元格由本地规则填写"
+                result["prefilled_count"] = len(prefilled)
+                result["prefilled_cells"] = prefilled[:Config.CSV_REJECTED_REPORT_LIMIT]
+            return result
                 
         except Exception as e:
             error_msg = f"处理CSV文件时发生错误: {str(e)}"
@@ -96,3 +120,215 @@ class CSVService:
                 "success": False,
                 "message": error_msg
             }
+
+    @staticmethod
+    def _load_prompt(name: str) -> str:
+        """从文件读取提示词模板"""
+        prompt_path = os.path.join(os.path.dirname(__file__), "prompts", name)
+        with open(prompt_path, "r", encoding="utf-8") as f:
+            return f.read()
+
+    @staticmethod
+    def _prefill(df: pd.DataFrame) -> List[Dict[str, Any]]:
+        """用本地规则推断空白单元格，直接填写置信度足够高的部分，返回已填写的单元格"""
+        engine = PrefillEngine(min_confidence=Config.CSV_PREFILL_MIN_CONFIDENCE)
+        accepted, uncertain = engine.split(engine.suggest(df))
+        rejected = apply_cells(df, accepted)
+        if rejected:
+            rejected_keys = {(cell["row"], cell["column"]) for cell in rejected}
+            accepted = [cell for cell in accepted if (cell["row"], cell["column"]) not in rejected_keys]
+        print(f"本地预填写: {len(accepted)}个单元格已填写，{len(uncertain)}个置信度不足交给模型")
+        return accepted
+
+    @staticmethod
+    def _result(output_path: str, failed_batches: int, rejected: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """生成处理成功的返回结果，附带未通过校验的单元格(最多CSV_REJECTED_REPORT_LIMIT个)"""
+        message = "CSV文件处理成功"
+        if failed_batches:
+            message += f"，其中{failed_batches}批数据填写失败，对应单元格保持空白"
+        if rejected:
+            message += f"，{len(rejected)}个单元格未通过校验，保持原样"
+        return {
+            "success": True,
+            "message": message,
+            "file_path": output_path,
+            "rejected_count": len(rejected),
+            "rejected_cells": rejected[:Config.CSV_REJECTED_REPORT_LIMIT]
+        }
+
+    async def _fill_whole(self, df: pd.DataFrame, requirement: Optional[str]) -> Any:
+        """整表一次性发送给模型"""
+        # 准备提示词
+        csv_content = df.fillna("[BLANK]").to_csv(index=False)
+        
+        # 构建提示词参数
+        prompt_params = {
+            "csv_content": csv_content,
+            "requirement": requirement if requirement else ""
+        }
+        
+        # 填充提示词
+        prompt = self._load_prompt("csv_handler.txt").format(**prompt_params)
+        
+        print("发送提示词请求...")
+        if requirement:
+            print(f"用户填写要求: {requirement}")
+        
+        # 生成回复，相同表格和要求的回复可以直接复用
+        response = await self.llm_service.generate_response(
+            prompt, temperature=Config.CSV_FILL_TEMPERATURE, is_json=True, cache=True,
+            priority="background"
+        )
+        if not isinstance(response, dict) or "cells" not in response:
+            await self.llm_service.forget_cached(prompt, Config.CSV_FILL_TEMPERATURE)
+        
+        print("AI响应:", response)
+        return response
+
+    def _make_batches(self, blank_rows: pd.DataFrame) -> List[pd.DataFrame]:
+        """
+        按行数和token预算把含空白的行分批
+        逐行序列化计数：单元格内含换行时，整表to_csv的行与DataFrame的行对不上
+        """
+        batches = []
+        start, batch_tokens = 0, 0
+        for position, row in enumerate(blank_rows.itertuples(name=None)):
+            buffer = io.StringIO()
+            csv.writer(buffer).writerow(row)
+            tokens = count_tokens(buffer.getvalue())
+            if position > start and (position - start >= Config.CSV_BATCH_MAX_ROWS
+                                     or batch_tokens + tokens > Config.CSV_BATCH_MAX_TOKENS):
+                batches.append(blank_rows.iloc[start:position])
+                start, batch_tokens = position, 0
+            batch_tokens += tokens
+        if start < len(blank_rows):
+            batches.append(blank_rows.iloc[start:])
+        return batches
+
+    async def _process_streaming(
+        self,
+        file_path: str,
+        requirement: Optional[str],
+        progress: Optional[Callable[[int, int], None]] = None,
+        output_path: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        大文件流式处理：分块扫描并把含空白的行溢写到临时文件，
+        再分块读回这些行分批填写，最后分块重写整个文件
+        """
+        # 溢写文件每个任务单独命名并加租约，避免同一上传文件的并发任务互相覆盖或被配额淘汰
+        store = get_artifact_store()
+        spill_path = store.output_path(file_path, "_blank_rows.csv")
+        store.acquire(spill_path)
+        try:
+            scan = await run_blocking("csv", Config.CSV_IO_MAX_WORKERS, scan_csv, file_path, spill_path)
+            if not scan.has_blanks:
+                return {
+                    "success": True,
+                    "message": "CSV文件中没有需要填写的空白单元格",
+                    "file_path": file_path
+                }
+            
+            print(f"流式处理: 共{scan.row_count}行，其中{scan.blank_row_count}行含空白")
+            cells, failed_batches, total_batches = [], 0, 0
+            blank_chunks = iter_blank_row_batches(scan)
+            while True:
+                blank_rows = await run_blocking("csv", Config.CSV_IO_MAX_WORKERS, next, blank_chunks, None)
+                if blank_rows is None:
+                    break
+                # 批次总数随读入的分块累加
+                chunk_progress = None
+                if progress:
+                    chunk_progress = lambda done, total, offset=total_batches: progress(offset + done, offset + total)
+                chunk_cells, chunk_failed, chunk_total = await self._fill_in_batches(
+                    blank_rows, scan.complete_rows, requirement, chunk_progress
+                )
+                cells.extend(chunk_cells)
+                failed_batches += chunk_failed
+                total_batches += chunk_total
+        finally:
+            if os.path.exists(spill_path):
+                os.remove(spill_path)
+            store.release(spill_path)
+        
+        if failed_batches == total_batches:
+            return {
+                "success": False,
+                "message": "模型返回的格式不正确"
+            }
+        
+        output_path = output_path or os.path.splitext(file_path)[0] + "_filled.csv"
+        rejected = await run_blocking(
+            "csv", Config.CSV_IO_MAX_WORKERS,
+            write_filled_csv, file_path, output_path, cells, apply_cells, scan.dtypes()
+        )
+        
+        return self._result(output_path, failed_batches, rejected)
+
+    async def _fill_in_batches(
+        self,
+        blank_rows: pd.DataFrame,
+        complete_rows: pd.DataFrame,
+        requirement: Optional[str],
+        progress: Optional[Callable[[int, int], None]] = None
+    ):
+        """
+        分批填写：只发送含空白的行(索引为原始行号)，附带表头和少量完整数据作为参考，
+        批次并发处理(受CSV_MAX_CONCURRENCY限制)，每批单独重试
+        返回(单元格列表, 失败批次数, 总批次数)
+        """
+        columns = blank_rows.columns
+        blank_rows = blank_rows.fillna("[BLANK]")
+        context_rows = complete_rows.to_csv(index=False)
+        
+        prompt_template = self._load_prompt("csv_chunk_handler.txt")
+        batches = self._make_batches(blank_rows)
+        semaphore = asyncio.Semaphore(Config.CSV_MAX_CONCURRENCY)
+        print(f"分批填写: {len(blank_rows)}行待填写，共{len(batches)}批")
+        done_batches = 0
+        if progress:
+            progress(0, len(batches))
+        
+        async def fill_batch(batch: pd.DataFrame) -> Optional[List[Dict[str, Any]]]:
+            nonlocal done_batches
+            try:
+                return await fill_batch_once(batch)
+            finally:
+                done_batches += 1
+                if progress:
+                    progress(done_batches, len(batches))
+        
+        async def fill_batch_once(batch: pd.DataFrame) -> Optional[List[Dict[str, Any]]]:
+            prompt = prompt_template.format(
+                requirement=requirement if requirement else "",
+                context_rows=context_rows,
+                row_column=Config.CSV_ROW_COLUMN,
+                csv_content=batch.to_csv(index=True, index_label=Config.CSV_ROW_COLUMN)
+            )
+            batch_rows = set(batch.index.tolist())
+            
+            async with semaphore:
+                for attempt in range(Config.CSV_BATCH_RETRIES + 1):
+                    response = await self.llm_service.generate_response(
+                        prompt, temperature=Config.CSV_FILL_TEMPERATURE, is_json=True, cache=True,
+                        priority="background"
+                    )
+                    if isinstance(response, dict) and isinstance(response.get("cells"), list):
+                        # 只保留属于本批且列名存在的单元格
+                        return [
+                            cell for cell in response["cells"]
+                            if isinstance(cell, dict)
+                            and str(cell.get("row", "")).lstrip("-").isdigit()
+                            and int(cell["row"]) in batch_rows
+                            and cell.get("column") in columns
+                            and "content" in cell
+                        ]
+                    await self.llm_service.forget_cached(prompt, Config.CSV_FILL_TEMPERATURE)
+                    print(f"第{attempt + 1}次填写批次(行{batch.index[0]}-{batch.index[-1]})返回格式不正确")
+            return None
+        
+        results = await asyncio.gather(*(fill_batch(batch) for batch in batches))
+        
+        cells = [cell for result in results if result for cell in result]
+        failed_batches = sum(1 for result in results if result is None)
+        return cells, failed_batches, len(batches)
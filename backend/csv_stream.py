@@ -0,0 +1,74 @@
+import codecs
+import csv
+import io
+from typing import AsyncIterator, Callable, List, Optional
+
+from config import Config
+
+# 行处理函数：接收(行, 行号)，返回处理后的行，返回None时丢弃该行
+RowTransform = Callable[[List[str], int], Optional[List[str]]]
+
+
+def append_ok(row: List[str], index: int) -> List[str]:
+    """简单示例：往每行最后一列补充“OK”"""
+    return row + ["OK"]
+
+
+async def iter_csv_rows(source, chunk_size: int = None) -> AsyncIterator[List[str]]:
+    """
+    增量读取并解析CSV，逐行产出
+    source需提供async read(size)(如UploadFile)；按块读取并增量解码，
+    按换行切分后累计引号数，为偶数时才认为一条记录结束，支持字段内换行
+    """
+    chunk_size = chunk_size or Config.CSV_STREAM_CHUNK_BYTES
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+    pending = ""  # 尚未以换行结束的文本
+    record: List[str] = []  # 当前记录已读取的行(字段内含换行时有多行)
+    quotes = 0
+    
+    def parse(lines: List[str]) -> List[str]:
+        return next(csv.reader(io.StringIO("".join(lines))), [])
+    
+    while True:
+        chunk = await source.read(chunk_size)
+        parts = (pending + decoder.decode(chunk, final=not chunk)).split("\n")
+        pending = parts.pop()
+        for line in (part + "\n" for part in parts):
+            record.append(line)
+            quotes += line.count('"')
+            if quotes % 2 == 0:
+                yield parse(record)
+                record, quotes = [], 0
+        if not chunk:
+            break
+    
+    if pending:
+        record.append(pending)
+    if record:
+        yield parse(record)
+
+
+async def stream_csv_transform(
+    source,
+    transform: RowTransform = append_ok,
+    flush_bytes: int = None
+) -> AsyncIterator[bytes]:
+    """
+    流式转换CSV：逐行读取、处理并写出，内存占用与文件大小无关
+    输出缓冲超过flush_bytes时产出一次UTF-8字节块
+    """
+    flush_bytes = flush_bytes or Config.CSV_STREAM_CHUNK_BYTES
+    output = io.StringIO()
+    writer = csv.writer(output)
+    index = 0
+    async for row in iter_csv_rows(source):
+        row = transform(row, index)
+        if row is not None:
+            writer.writerow(row)
+        index += 1
+        if output.tell() >= flush_bytes:
+            yield output.getvalue().encode("utf-8")
+            output.seek(0)
+            output.truncate()
+    if output.tell():
+        yield output.getvalue().encode("utf-8")
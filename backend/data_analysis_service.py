@@ -1,11 +1,15 @@
 import pandas as pd
-import json
 import os
-from typing import Dict, Any, List
+from typing import Dict, Any
 
 from typing import Optional
 from config import Config
+from analysis_cache import file_hash, get_analysis_cache
+from column_profiler import ColumnProfile
+from csv_ingest import scan_csv, should_stream
+from executors import run_blocking
 from llm import LLMService
+from visualization_builder import VisualizationBuilder
 
 class DataAnalysisService:
     def __init__(self):
@@ -14,26 +18,48 @@ class DataAnalysisService:
             api_url=Config.LLM_API_URL
         )
     
-    async def analyze_csv(self, file_path: str, requirement: Optional[str] = None):
-        """分析CSV文件并生成数据见解"""
+    async def analyze_csv(self, file_path: str, requirement: Optional[str] = None, refresh: bool = False):
+        """
+        分析CSV文件并生成数据见解
+        相同文件内容、相同要求的结果会被缓存，refresh为True时跳过缓存重新分析
+        """
         try:
-            # 读取CSV文件
-            df = pd.read_csv(file_path)
-            
             # 从文件读取提示词模板
             prompt_path = os.path.join(os.path.dirname(__file__), "prompts", "data_analysis.txt")
             with open(prompt_path, "r", encoding="utf-8") as f:
                 prompt_template = f.read()
             
-            # 准备数据样本和统计信息
-            data_sample = df.head(5).to_string(index=False)
-            data_stats = df.describe().to_string()
+            cache = get_analysis_cache()
+            cache_key = None
+            if cache:
+                content_hash = await run_blocking("csv", Config.CSV_IO_MAX_WORKERS, file_hash, file_path)
+                cache_key = cache.make_key(content_hash, requirement, prompt_template, Config.LLM_MODEL)
+                if not refresh:
+                    cached = await run_blocking("cache", Config.CACHE_IO_MAX_WORKERS, cache.get, cache_key)
+                    if cached:
+                        print("使用缓存的分析结果")
+                        return {**cached, "cached": True}
+            
+            if should_stream(file_path):
+                # 大文件分块扫描：统计信息增量计算，可视化基于均匀抽样
+                scan = await run_blocking("csv", Config.CSV_IO_MAX_WORKERS, scan_csv, file_path)
+                df = scan.sample
+                profile = ColumnProfile(df, null_counts=scan.null_counts, row_count=scan.row_count)
+                data_sample = scan.head.to_string(index=False)
+                data_stats = scan.describe().to_string()
+            else:
+                # 读取CSV文件，列画像同时用于提示词和可视化数据
+                df = pd.read_csv(file_path)
+                profile = ColumnProfile(df)
+                data_sample = df.head(5).to_string(index=False)
+                data_stats = profile.stats_text()
+            column_info = profile.column_info_text()
             
             # 构建提示词参数
             prompt_params = {
                 "data_sample": data_sample,
                 "data_stats": data_stats,
-                "column_info": str(df.dtypes),
+                "column_info": column_info,
                 "requirement": requirement if requirement else "请进行全面的数据分析"
             }
             
@@ -41,15 +67,21 @@ class DataAnalysisService:
             prompt = prompt_template.format(**prompt_params)
             
             # 生成分析报告
-            analysis = await self.llm_service.generate_response(prompt)
+            analysis = await self.llm_service.generate_response(prompt, priority="background")
             
-            # 返回结果
-            return {
+            result = {
                 "success": True,
                 "analysis": analysis,
-                "visualization_data": self._prepare_visualization_data(df)
+                "visualization_data": self._prepare_visualization_data(df, profile)
             }
             
+            # 只缓存成功生成的分析
+            if cache and analysis:
+                await run_blocking("cache", Config.CACHE_IO_MAX_WORKERS, cache.put, cache_key, result)
+            
+            # 返回结果
+            return result
+            
         except Exception as e:
             error_msg = f"分析CSV文件时发生错误: {str(e)}"
             print(error_msg)
@@ -60,102 +92,34 @@ class DataAnalysisService:
                 "message": error_msg
             }
     
-    def _generate_stats(self, df: pd.DataFrame) -> Dict[str, Any]:
+    def _generate_stats(self, df: pd.DataFrame, profile: Optional[ColumnProfile] = None) -> Dict[str, Any]:
         """生成数据的基本统计信息"""
-        # 尝试将数值列转换为数值类型
-        numeric_df = df.copy()
-        for col in numeric_df.columns:
-            try:
-                numeric_df[col] = pd.to_numeric(numeric_df[col])
-            except:
-                pass
+        profile = profile or ColumnProfile(df)
         
         # 仅为数值列计算统计数据
-        numeric_cols = numeric_df.select_dtypes(include=['number']).columns
         stats = {}
-        
-        if len(numeric_cols) > 0:
+        if profile.numeric_columns:
             stats["numeric"] = {
                 col: {
-                    "min": float(numeric_df[col].min()),
-                    "max": float(numeric_df[col].max()),
-                    "mean": float(numeric_df[col].mean()),
-                    "median": float(numeric_df[col].median())
-                } for col in numeric_cols
+                    "min": profile.profiles[col]["stats"]["min"],
+                    "max": profile.profiles[col]["stats"]["max"],
+                    "mean": profile.profiles[col]["stats"]["mean"],
+                    "median": profile.profiles[col]["stats"]["50%"]
+                } for col in profile.numeric_columns
             }
         
-        stats["row_count"] = len(df)
-        stats["column_count"] = len(df.columns)
+        stats["row_count"] = profile.row_count
+        stats["column_count"] = len(profile.columns)
         
         return stats
     
-    def _prepare_visualization_data(self, df: pd.DataFrame) -> Dict[str, Any]:
+    def _prepare_visualization_data(self, df: pd.DataFrame, profile: Optional[ColumnProfile] = None) -> Dict[str, Any]:
         """准备适合可视化的数据格式"""
-        # 尝试将数值列转换为数值类型
-        numeric_df = df.copy()
-        for col in numeric_df.columns:
-            try:
-                numeric_df[col] = pd.to_numeric(numeric_df[col])
-            except:
-                pass
-        
-        # 获取数值列和分类列
-        numeric_cols = numeric_df.select_dtypes(include=['number']).columns.tolist()
-        category_cols = [col for col in df.columns if col not in numeric_cols]
-        
-        # 准备不同图表类型的数据
-        viz_data = {
-            "columns": df.columns.tolist(),
-            "numeric_columns": numeric_cols,
-            "category_columns": category_cols,
-            "chart_data": {}
-        }
-        
-        # 如果有数值列和分类列，可以创建分组图表数据
-        if numeric_cols and category_cols:
-            # 选择第一个分类列和第一个数值列作为示例
-            cat_col = category_cols[0]
-            num_col = numeric_cols[0]
-            
-            # 分组数据
-            grouped = df.groupby(cat_col)[num_col].mean().reset_index()
-            viz_data["chart_data"]["bar"] = {
-                "categories": grouped[cat_col].tolist(),
-                "series": [{
-                    "name": num_col,
-                    "data": grouped[num_col].tolist()
-                }]
-            }
-        
-        # 如果只有数值列，可以创建折线图数据
-        elif numeric_cols:
-            # 使用前10行作为示例
-            sample = df[numeric_cols].head(10)
-            viz_data["chart_data"]["line"] = {
-                "categories": sample.index.tolist(),
-                "series": [{
-                    "name": col,
-                    "data": sample[col].tolist()
-                } for col in numeric_cols]
-            }
-            
-        # 为饼图准备数据（使用第一个类别列的计数）- 修复这部分代码
-        if category_cols:
-            cat_col = category_cols[0]
-            # value_counts().reset_index() 返回两列DataFrame
-            # 第一列是原始值，第二列是计数
-            pie_data = df[cat_col].value_counts().reset_index()
-            
-            # 正确引用列名
-            name_col = pie_data.columns[0]  # 第一列包含类别名称
-            count_col = pie_data.columns[1]  # 第二列包含计数值
-            
-            viz_data["chart_data"]["pie"] = {
-                "data": [{"name": str(row[name_col]), "value": int(row[count_col])} 
-                        for _, row in pie_data.iterrows()]
-            }
-            
-        return viz_data
+        builder = VisualizationBuilder(
+            max_categories=Config.VIZ_MAX_CATEGORIES,
+            max_points=Config.VIZ_MAX_POINTS
+        )
+        return builder.build(df, profile)
     
     async def _generate_analysis_insights(self, df: pd.DataFrame) -> str:
         """使用AI生成数据分析见解"""
@@ -181,7 +145,7 @@ class DataAnalysisService:
         """
         
         try:
-            response = await self.llm_service.generate_response(prompt)
+            response = await self.llm_service.generate_response(prompt, priority="background")
             return response if isinstance(response, str) else "无法生成分析见解"
         except Exception as e:
             return f"生成分析见解时出错: {str(e)}"
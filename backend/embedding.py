@@ -1,14 +1,121 @@
 import httpx
-import asyncio
 from typing import List, Optional
-import time
+from config import Config
+from embedding_cache import EmbeddingCache, get_embedding_cache
+from executors import run_blocking
+from llm import LLMService
+from resilience import APIStatusError, CircuitBreaker, RetryPolicy, get_breaker
+from tokens import estimate_tokens
 
 class EmbeddingService:
-    def __init__(self, api_key: str, api_url: str, model: str, dimension: int):
+    def __init__(
+        self,
+        api_key: str,
+        api_url: str,
+        model: str,
+        dimension: int,
+        max_batch_size: int = Config.EMBEDDING_BATCH_SIZE,
+        max_batch_tokens: int = Config.EMBEDDING_BATCH_MAX_TOKENS,
+        cache: Optional[EmbeddingCache] = None
+    ):
         self.api_key = api_key
         self.api_url = api_url
         self.model = model
         self.dimension = dimension
+        self.max_batch_size = max_batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.cache = cache if cache is not None else get_embedding_cache()
+
+    def _cache_get(self, text: str) -> Optional[List[float]]:
+        return self.cache.get(self.cache.make_key(self.model, text)) if self.cache else None
+
+    def _cache_put(self, text: str, embedding: Optional[List[float]]) -> None:
+        if self.cache and embedding is not None:
+            self.cache.put(self.cache.make_key(self.model, text), embedding)
+
+    async def _acache_get(self, text: str) -> Optional[List[float]]:
+        """内存命中直接返回，否则在线程池中查磁盘，避免SQLite读写阻塞事件循环"""
+        if not self.cache:
+            return None
+        key = self.cache.make_key(self.model, text)
+        cached = self.cache.get_memory(key)
+        if cached is None:
+            cached = await run_blocking("cache", Config.CACHE_IO_MAX_WORKERS, self.cache.get, key)
+        return cached
+
+    async def _acache_put(self, text: str, embedding: Optional[List[float]]) -> None:
+        if self.cache and embedding is not None:
+            await run_blocking("cache", Config.CACHE_IO_MAX_WORKERS, self._cache_put, text, embedding)
+
+    @property
+    def breaker(self) -> CircuitBreaker:
+        return get_breaker(f"Embedding {LLMService._host_key(self.api_url)}")
+
+    @staticmethod
+    def _retry_policy(max_retries: int, retry_delay: float) -> RetryPolicy:
+        return RetryPolicy(
+            max_retries=max_retries,
+            base_delay=retry_delay,
+            deadline=Config.EMBEDDING_REQUEST_DEADLINE
+        )
+
+    def _headers(self) -> dict:
+        return {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {self.api_key}"
+        }
+
+    @staticmethod
+    def _parse_embedding(response: httpx.Response) -> List[float]:
+        if response.status_code != 200:
+            raise APIStatusError("Embedding", response.status_code)
+        
+        response_data = response.json()
+        if "data" not in response_data or not response_data["data"]:
+            raise Exception("Invalid API response format")
+            
+        embedding = response_data["data"][0]["embedding"]
+        print("embedding size:", len(embedding), "embedding:", embedding[0:10])
+        return embedding
+
+    async def aget_embedding(
+        self,
+        text: str,
+        max_retries: int = 3,
+        retry_delay: float = 1.0
+    ) -> Optional[List[float]]:
+        """get_embedding的异步版本，复用共享连接池，不阻塞事件循环"""
+        if not text or not text.strip():
+            return None
+        
+        cached = await self._acache_get(text)
+        if cached is not None:
+            return cached
+            
+        clean_text = text.replace('\r\n', '\n').replace('\r', '\n')
+        client = LLMService.get_client(self.api_url)
+        
+        async def attempt():
+            response = await client.post(
+                self.api_url,
+                json={
+                    "model": self.model,
+                    "input": clean_text
+                },
+                headers=self._headers(),
+                timeout=30.0
+            )
+            return self._parse_embedding(response)
+        
+        try:
+            embedding = await self._retry_policy(max_retries, retry_delay).run_async(
+                self.breaker, attempt, label="Embedding API调用"
+            )
+        except Exception as e:
+            print(f"Embedding API调用失败: {str(e)}")
+            return None
+        await self._acache_put(text, embedding)
+        return embedding
 
     def get_embedding(
         self,
@@ -19,47 +126,131 @@ class EmbeddingService:
         # 如果输入为空，直接返回 None
         if not text or not text.strip():
             return None
-            
-        retry_count = 0
         
+        cached = self._cache_get(text)
+        if cached is not None:
+            return cached
+            
         # 清理输入文本
         clean_text = text.replace('\r\n', '\n').replace('\r', '\n')
         
-        while retry_count <= max_retries:
-            try:
-                with httpx.Client(verify=False, timeout=30.0) as client:
-                    headers = {
-                        "Content-Type": "application/json",
-                        "Authorization": f"Bearer {self.api_key}"
-                    }
-                    
-                    data = {
+        def attempt():
+            with httpx.Client(verify=False, timeout=30.0) as client:
+                data = {
+                    "model": self.model,
+                    "input": clean_text
+                }
+                
+                response = client.post(
+                    self.api_url,
+                    json=data,
+                    headers=self._headers()
+                )
+                return self._parse_embedding(response)
+        
+        try:
+            embedding = self._retry_policy(max_retries, retry_delay).run(
+                self.breaker, attempt, label="Embedding API调用"
+            )
+        except Exception as e:
+            print(f"Embedding API调用失败: {str(e)}")
+            return None
+        self._cache_put(text, embedding)
+        return embedding
+
+    def _make_batches(self, texts: List[str]) -> List[List[int]]:
+        """按条数上限和token预算把文本下标分批"""
+        batches = []
+        batch, batch_tokens = [], 0
+        for index, text in enumerate(texts):
+            tokens = estimate_tokens(text)
+            if batch and (len(batch) >= self.max_batch_size or batch_tokens + tokens > self.max_batch_tokens):
+                batches.append(batch)
+                batch, batch_tokens = [], 0
+            batch.append(index)
+            batch_tokens += tokens
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def get_embeddings(
+        self,
+        texts: List[str],
+        max_retries: int = 3,
+        retry_delay: float = 1.0
+    ) -> List[Optional[List[float]]]:
+        """
+        批量获取embedding，一个批次只发一次请求(OpenAI兼容接口的input支持列表)
+        批次请求失败或结果缺失的文本，逐条回退到get_embedding
+        返回结果与texts一一对应，空文本或失败时为None
+        """
+        results: List[Optional[List[float]]] = [None] * len(texts)
+        clean_texts = {}
+        for index, text in enumerate(texts):
+            if not text or not text.strip():
+                continue
+            cached = self._cache_get(text)
+            if cached is not None:
+                results[index] = cached
+            else:
+                clean_texts[index] = text.replace('\r\n', '\n').replace('\r', '\n')
+        indexes = list(clean_texts.keys())
+        
+        for batch in self._make_batches([clean_texts[index] for index in indexes]):
+            batch_indexes = [indexes[position] for position in batch]
+            embeddings = self._request_batch(
+                [clean_texts[index] for index in batch_indexes],
+                max_retries,
+                retry_delay
+            )
+            
+            for index, embedding in zip(batch_indexes, embeddings):
+                if embedding is None:
+                    print(f"批量embedding缺少第{index}条结果，改为单独请求")
+                    embedding = self.get_embedding(texts[index], max_retries, retry_delay)
+                else:
+                    self._cache_put(texts[index], embedding)
+                results[index] = embedding
+        
+        return results
+
+    def _request_batch(
+        self,
+        batch_texts: List[str],
+        max_retries: int,
+        retry_delay: float
+    ) -> List[Optional[List[float]]]:
+        """发送一个批次的请求，失败时返回全None，由调用方逐条回退"""
+        def attempt():
+            with httpx.Client(verify=False, timeout=30.0) as client:
+                response = client.post(
+                    self.api_url,
+                    json={
                         "model": self.model,
-                        "input": clean_text
-                    }
-                    
-                    response = client.post(
-                        self.api_url,
-                        json=data,
-                        headers=headers
-                    )
-                    
-                    if response.status_code != 200:
-                        raise Exception(f"Embedding API error: {response.status_code}")
-                    
-                    response_data = response.json()
-                    if "data" not in response_data or not response_data["data"]:
-                        raise Exception("Invalid API response format")
-                        
-                    embedding = response_data["data"][0]["embedding"]
-                    print("embedding size:", len(embedding), "embedding:", embedding[0:10])
-                    return embedding
-                    
-            except Exception as e:
-                if retry_count == max_retries:
-                    print(f"Embedding API调用失败, 超过最大重试次数: {str(e)}")
-                    return None
-                    
-                retry_count += 1
-                print(f"Embedding API调用失败，{retry_delay}秒后进行第{retry_count}次重试...")
-                time.sleep(retry_delay) 
\ No newline at end of file
+                        "input": batch_texts
+                    },
+                    headers=self._headers()
+                )
+                
+                if response.status_code != 200:
+                    raise APIStatusError("Embedding", response.status_code)
+                
+                response_data = response.json()
+                if "data" not in response_data or not response_data["data"]:
+                    raise Exception("Invalid API response format")
+                
+                embeddings: List[Optional[List[float]]] = [None] * len(batch_texts)
+                for position, item in enumerate(response_data["data"]):
+                    index = item.get("index", position)
+                    if 0 <= index < len(batch_texts) and item.get("embedding"):
+                        embeddings[index] = item["embedding"]
+                print(f"批量embedding完成: {len(batch_texts)}条")
+                return embeddings
+        
+        try:
+            return self._retry_policy(max_retries, retry_delay).run(
+                self.breaker, attempt, label="批量Embedding API调用"
+            )
+        except Exception as e:
+            print(f"批量Embedding API调用失败: {str(e)}")
+            return [None] * len(batch_texts)
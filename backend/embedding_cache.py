@@ -0,0 +1,50 @@
+import hashlib
+import re
+from array import array
+from typing import Dict, List, Optional
+
+from config import Config
+from sqlite_cache import SQLiteLRUCache
+
+
+class EmbeddingCache(SQLiteLRUCache):
+    """
+    按内容寻址的embedding缓存
+    键为(模型, 规范化文本的哈希)，向量以float32存储
+    """
+    def __init__(self, path: str, memory_size: int = 1024, max_entries: int = 100000):
+        super().__init__(path, "embeddings", "vector", memory_size, max_entries)
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """规范化文本：去掉首尾空白、合并连续空白、统一小写"""
+        return re.sub(r'\s+', ' ', text).strip().lower()
+
+    @classmethod
+    def make_key(cls, model: str, text: str) -> str:
+        digest = hashlib.sha256(cls.normalize(text).encode('utf-8')).hexdigest()
+        return f"{model}:{digest}"
+
+    def _encode(self, embedding: List[float]) -> bytes:
+        return array('f', embedding).tobytes()
+
+    def _decode(self, raw: bytes) -> List[float]:
+        return array('f', raw).tolist()
+
+
+_caches: Dict[str, EmbeddingCache] = {}
+
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """获取全局共享的embedding缓存，未启用时返回None"""
+    if not Config.EMBEDDING_CACHE_ENABLED:
+        return None
+    cache = _caches.get(Config.EMBEDDING_CACHE_PATH)
+    if cache is None:
+        cache = EmbeddingCache(
+            Config.EMBEDDING_CACHE_PATH,
+            memory_size=Config.EMBEDDING_CACHE_MEMORY_SIZE,
+            max_entries=Config.EMBEDDING_CACHE_MAX_ENTRIES
+        )
+        _caches[Config.EMBEDDING_CACHE_PATH] = cache
+    return cache
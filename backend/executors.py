@@ -0,0 +1,32 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+# 按用途划分的有界线程池，用来运行同步阻塞的SDK/数据库调用
+# 避免阻塞事件循环，同时限制某一类慢调用能占用的线程数
+_executors: Dict[str, ThreadPoolExecutor] = {}
+
+
+def get_executor(name: str, max_workers: int) -> ThreadPoolExecutor:
+    """获取指定名称的线程池，不存在时创建"""
+    executor = _executors.get(name)
+    if executor is None:
+        executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        _executors[name] = executor
+    return executor
+
+
+async def run_blocking(name: str, max_workers: int, func: Callable, *args, **kwargs) -> Any:
+    """在指定线程池中运行阻塞函数并等待结果"""
+    loop = asyncio.get_running_loop()
+    executor = get_executor(name, max_workers)
+    return await loop.run_in_executor(executor, functools.partial(func, *args, **kwargs))
+
+
+def shutdown_executors() -> None:
+    """应用关闭时释放所有线程池"""
+    executors = list(_executors.values())
+    _executors.clear()
+    for executor in executors:
+        executor.shutdown(wait=False, cancel_futures=True)
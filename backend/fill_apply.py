@@ -0,0 +1,78 @@
+from typing import Any, Dict, List
+
+import numpy as np
+import pandas as pd
+
+
+def _coerce(column: pd.Series, contents: pd.Series):
+    """
+    按列类型转换填写内容，返回(转换后的值, 是否有效)
+    已有数值的数值列只接受数值；全空的列内容都是数值时按数值填写，否则转为文本列
+    """
+    if pd.api.types.is_datetime64_any_dtype(column):
+        values = pd.to_datetime(contents, errors="coerce")
+        return values, values.notna(), "日期"
+    if pd.api.types.is_numeric_dtype(column) and not pd.api.types.is_bool_dtype(column):
+        values = pd.to_numeric(contents, errors="coerce")
+        valid = values.notna()
+        if column.notna().any() or valid.all():
+            return values, valid, "数值"
+    return contents.astype(str), pd.Series(True, index=contents.index), "文本"
+
+
+def apply_cells(df: pd.DataFrame, cells: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    把模型返回的单元格填入DataFrame，返回被拒绝的单元格(附reason)
+    同一单元格重复时保留第一次出现的有效内容；只填写原本为空的单元格，内容按列类型校验转换；
+    每列只做一次向量化赋值，避免逐个赋值时反复升级列类型
+    """
+    if not cells:
+        return []
+    
+    cells = [cell if isinstance(cell, dict) else {} for cell in cells]
+    frame = pd.DataFrame({
+        "row": [cell.get("row") for cell in cells],
+        "column": [cell.get("column") for cell in cells],
+        "content": [cell.get("content") for cell in cells]
+    }, dtype=object)
+    frame["reason"] = None
+    frame["row_number"] = rows = pd.to_numeric(frame["row"], errors="coerce")
+    
+    def reject(mask: pd.Series, reason: str) -> None:
+        frame.loc[mask & frame["reason"].isna(), "reason"] = reason
+    
+    reject(rows.isna() | (rows % 1 != 0), "行号无效")
+    reject(~frame["column"].isin(df.columns), "列不存在")
+    reject(~rows.isin(df.index), "行不存在")
+    reject(frame["content"].isna() | (frame["content"].astype(str).str.strip() == ""), "内容为空")
+    # 只在尚未被拒绝的单元格中去重，避免空内容等无效的第一次出现挡住之后的有效内容
+    pending = frame["reason"].isna()
+    duplicated = frame[pending].duplicated(["row_number", "column"], keep="first")
+    reject(duplicated.reindex(frame.index, fill_value=False), "重复的单元格")
+    
+    for column, group in frame[frame["reason"].isna()].groupby("column", sort=False):
+        group_rows = group["row_number"].to_numpy(dtype=np.int64)
+        blank = df.loc[group_rows, column].isna().to_numpy()
+        reject(pd.Series(~blank, index=group.index).reindex(frame.index, fill_value=False), "单元格原本不为空")
+        group = group[blank]
+        if group.empty:
+            continue
+        
+        values, valid, expected = _coerce(df[column], group["content"])
+        reject(pd.Series(~valid, index=group.index).reindex(frame.index, fill_value=False), f"类型不匹配(应为{expected})")
+        values = values[valid]
+        if values.empty:
+            continue
+        if expected == "数值" and pd.api.types.is_integer_dtype(df[column]):
+            # 可空整数列(流式写出时按整列类型读取)：填入整数保持整数列，填入小数时改为浮点列
+            if (values % 1 == 0).all():
+                values = values.astype("int64")
+            else:
+                df[column] = df[column].astype("Float64")
+        if expected == "文本" and not (pd.api.types.is_object_dtype(df[column])
+                                      or pd.api.types.is_string_dtype(df[column])):
+            df[column] = df[column].astype(object)
+        df.loc[group.loc[valid, "row_number"].to_numpy(dtype=np.int64), column] = values.to_numpy()
+    
+    rejected = frame[frame["reason"].notna()]
+    return rejected[["row", "column", "content", "reason"]].to_dict("records")
@@ -0,0 +1,195 @@
+import asyncio
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from config import Config
+
+
+class Job:
+    """
+    后台任务
+    status依次为pending -> running -> succeeded/failed，progress为{"done", "total", "message"}
+    每次状态或进度变化都会递增version并通知等待者
+    """
+    def __init__(self, kind: str, backend: str, handler: Callable[..., Awaitable[Any]], args: tuple):
+        self.id = str(uuid.uuid4())
+        self.kind = kind
+        self.backend = backend
+        self.status = "pending"
+        self.progress: Dict[str, Any] = {"done": 0, "total": 0, "message": "排队中"}
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.version = 0
+        self._handler = handler
+        self._args = args
+        self._changed = asyncio.Condition()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("succeeded", "failed")
+
+    def report(self, done: Optional[int] = None, total: Optional[int] = None, message: Optional[str] = None) -> None:
+        """更新进度，供任务处理函数调用"""
+        if done is not None:
+            self.progress["done"] = done
+        if total is not None:
+            self.progress["total"] = total
+        if message is not None:
+            self.progress["message"] = message
+        self._notify()
+
+    def _notify(self) -> None:
+        self.version += 1
+        asyncio.get_running_loop().create_task(self._wake())
+
+    async def _wake(self) -> None:
+        async with self._changed:
+            self._changed.notify_all()
+
+    async def wait_change(self, version: int, timeout: Optional[float] = None) -> None:
+        """等待任务在给定版本之后发生变化"""
+        async with self._changed:
+            try:
+                await asyncio.wait_for(
+                    self._changed.wait_for(lambda: self.version > version or self.finished),
+                    timeout
+                )
+            except asyncio.TimeoutError:
+                pass
+
+    async def wait(self) -> None:
+        """等待任务结束"""
+        while not self.finished:
+            await self.wait_change(self.version)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "progress": dict(self.progress),
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at
+        }
+
+
+class JobQueue:
+    """
+    后台任务队列
+    提交后立即返回任务，固定数量的worker按提交顺序处理，
+    每个后端(如llm)有单独的并发上限，避免突发上传压垮模型服务；
+    已结束的任务保留一段时间供客户端查询，排队任务数超过上限时拒绝提交
+    """
+    def __init__(
+        self,
+        max_workers: int = 4,
+        backend_limits: Optional[Dict[str, int]] = None,
+        max_pending: int = 100,
+        result_ttl: float = 3600
+    ):
+        self.max_workers = max_workers
+        self.backend_limits = backend_limits or {}
+        self.max_pending = max_pending
+        self.result_ttl = result_ttl
+        self._jobs: Dict[str, Job] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    def submit(self, kind: str, handler: Callable[..., Awaitable[Any]], *args, backend: str = "llm") -> Optional[Job]:
+        """
+        提交任务，handler以(job, *args)调用，返回值作为任务结果
+        队列已满时返回None
+        """
+        self._purge()
+        if self._queue is None:
+            self.start()
+        if self._queue.qsize() >= self.max_pending:
+            print(f"任务队列已满，拒绝{kind}任务")
+            return None
+        job = Job(kind, backend, handler, args)
+        self._jobs[job.id] = job
+        self._queue.put_nowait(job)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def _semaphore(self, backend: str) -> asyncio.Semaphore:
+        if backend not in self._semaphores:
+            self._semaphores[backend] = asyncio.Semaphore(self.backend_limits.get(backend, self.max_workers))
+        return self._semaphores[backend]
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self._queue.get()
+            try:
+                async with self._semaphore(job.backend):
+                    await self._run(job)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: Job) -> None:
+        job.status = "running"
+        job.report(message="处理中")
+        try:
+            job.result = await job._handler(job, *job._args)
+            job.status = "succeeded"
+        except asyncio.CancelledError:
+            job.status = "failed"
+            job.error = "任务已取消"
+            raise
+        except Exception as e:
+            print(f"{job.kind}任务失败: {str(e)}")
+            import traceback
+            traceback.print_exc()
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            job.finished_at = time.time()
+            job.report(message="已完成" if job.status == "succeeded" else "失败")
+
+    def _purge(self) -> None:
+        """清理超过保留时间的已结束任务"""
+        now = time.time()
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished and now - job.finished_at > self.result_ttl
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def start(self) -> None:
+        """启动worker"""
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+            loop = asyncio.get_running_loop()
+            self._workers = [loop.create_task(self._worker()) for _ in range(self.max_workers)]
+
+    async def stop(self) -> None:
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._queue = None
+
+
+_queue: Optional[JobQueue] = None
+
+
+def get_job_queue() -> JobQueue:
+    """获取全局共享的任务队列"""
+    global _queue
+    if _queue is None:
+        _queue = JobQueue(
+            max_workers=Config.JOB_MAX_WORKERS,
+            backend_limits=Config.JOB_BACKEND_LIMITS,
+            max_pending=Config.JOB_MAX_PENDING,
+            result_ttl=Config.JOB_RESULT_TTL
+        )
+    return _queue
@@ -1,62 +1,301 @@
 import httpx
 import asyncio
-from typing import List, Dict
+import copy
+import hashlib
+import time
+from typing import Any, List, Dict, AsyncIterator, Optional, Union
 import json
 import re
+from admission import AdmissionController, AdmissionError
+from config import Config
+from executors import run_blocking
+from llm_cache import get_llm_cache
+from resilience import APIStatusError, CircuitBreaker, RetryPolicy, get_breaker
 
 class LLMService:
+    # 所有实例共享的连接池，按服务地址(scheme://host:port)划分
+    # 在FastAPI启动时创建，关闭时释放，避免每次请求重新建立TCP/TLS连接
+    _clients: Dict[str, httpx.AsyncClient] = {}
+    # 每个服务地址的准入控制，以及正在进行的相同请求(用于合并)
+    _admission: Dict[str, AdmissionController] = {}
+    _pending: Dict[str, asyncio.Task] = {}
+
     def __init__(self, api_key: str, api_url: str):
         self.api_key = api_key
         self.api_url = api_url
+
+    @staticmethod
+    def _host_key(api_url: str) -> str:
+        """连接池按主机划分的键"""
+        url = httpx.URL(api_url)
+        return f"{url.scheme}://{url.host}:{url.port or ''}"
+
+    @classmethod
+    def _create_client(cls) -> httpx.AsyncClient:
+        """创建带连接上限的长连接客户端"""
+        return httpx.AsyncClient(
+            verify=False,
+            timeout=httpx.Timeout(Config.LLM_TIMEOUT, pool=Config.LLM_POOL_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=Config.LLM_MAX_CONNECTIONS_PER_HOST,
+                max_keepalive_connections=Config.LLM_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=Config.LLM_KEEPALIVE_EXPIRY
+            )
+        )
+
+    @classmethod
+    def get_client(cls, api_url: str) -> httpx.AsyncClient:
+        """获取某个服务地址的共享客户端，不存在或已关闭时重新创建"""
+        key = cls._host_key(api_url)
+        client = cls._clients.get(key)
+        if client is None or client.is_closed:
+            client = cls._create_client()
+            cls._clients[key] = client
+        return client
+
+    @classmethod
+    async def startup(cls, api_urls: List[str]) -> None:
+        """应用启动时预先创建连接池"""
+        for api_url in api_urls:
+            cls.get_client(api_url)
+
+    @classmethod
+    async def shutdown(cls) -> None:
+        """应用关闭时释放所有连接"""
+        clients = list(cls._clients.values())
+        cls._clients.clear()
+        for client in clients:
+            await client.aclose()
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        return self.get_client(self.api_url)
+
+    @property
+    def breaker(self) -> CircuitBreaker:
+        """该服务地址的熔断器，后端连续不可用时直接失败，不再排队等待超时"""
+        return get_breaker(f"LLM {self._host_key(self.api_url)}")
+
+    def _retry_policy(self, max_retries: int) -> RetryPolicy:
+        # max_retries为总尝试次数
+        return RetryPolicy(max_retries=max(max_retries - 1, 0), deadline=Config.LLM_REQUEST_DEADLINE)
+
+    @property
+    def admission(self) -> AdmissionController:
+        """该服务地址的准入控制，限制同时进行的请求数并让对话请求优先"""
+        key = self._host_key(self.api_url)
+        if key not in self._admission:
+            self._admission[key] = AdmissionController(
+                max_in_flight=Config.LLM_MAX_IN_FLIGHT,
+                reserved_interactive=Config.LLM_RESERVED_INTERACTIVE,
+                max_waiting=Config.LLM_MAX_WAITING,
+                timeouts=Config.LLM_ADMISSION_TIMEOUT
+            )
+        return self._admission[key]
         
+    def _headers(self) -> Dict[str, str]:
+        return {
+            "Authorization": f"Bearer {self.api_key}",
+            "Connection": "keep-alive",
+            "Content-Type": "application/json"
+        }
+
+    @staticmethod
+    def _payload(message: Union[str, List[Dict]], temperature: float, stream: bool = False) -> Dict:
+        # message可以是单条用户消息，也可以是完整的消息列表
+        if isinstance(message, list):
+            messages = message
+        else:
+            messages = [
+                {
+                    "role": "user", 
+                    "content": message
+                }
+            ]
+        payload = {
+            "model": Config.LLM_MODEL,
+            "messages": messages,
+            "temperature": temperature,
+        }
+        if stream:
+            payload["stream"] = True
+        if Config.LLM_CACHE_PROMPT:
+            payload["cache_prompt"] = True
+        return payload
+
     async def generate_response(
         self, 
-        message: str,
+        message: Union[str, List[Dict]],
         temperature: float = 0.7,
         max_retries: int = 3,
-        is_json: bool = False
+        is_json: bool = False,
+        cache: bool = False,
+        priority: str = "interactive"
+    ) -> Any:
+        """
+        生成回复，失败时重试
+        cache为True时先查回复缓存，成功后写入；默认只缓存temperature为0的调用
+        priority为interactive(对话)或background(CSV填写、数据分析)，请求过多时按优先级排队
+        与正在进行的请求完全相同时不再重复发送，直接共用其结果
+        """
+        cache_key = self._cache_key(message, temperature) if cache else None
+        if cache_key:
+            # 内存命中直接返回，磁盘查找在线程池中进行，不阻塞事件循环
+            cached = get_llm_cache().get_memory(cache_key)
+            if cached is None:
+                cached = await run_blocking("cache", Config.CACHE_IO_MAX_WORKERS, get_llm_cache().get, cache_key)
+            if cached is not None:
+                print("使用缓存的LLM回复")
+                return self._parse_json_response(cached) if is_json else cached
+        
+        # 是否写入缓存也属于请求的一部分，否则要求缓存的请求合并到不缓存的请求后结果不会被写入
+        request_key = self._request_key(message, temperature, is_json, cache_key)
+        task = self._pending.get(request_key)
+        if task is not None:
+            print("合并相同的进行中LLM请求")
+        else:
+            # 实际请求在独立任务中进行，某个等待者取消时不影响其他等待者
+            task = asyncio.ensure_future(
+                self._generate(message, temperature, max_retries, is_json, cache_key, priority)
+            )
+            self._pending[request_key] = task
+            task.add_done_callback(lambda _: self._pending.pop(request_key, None))
+        # 每个等待者都拿到独立的副本，某个调用方修改结果不会影响其他调用方
+        return copy.deepcopy(await asyncio.shield(task))
+
+    def _request_key(
+        self,
+        message: Union[str, List[Dict]],
+        temperature: float,
+        is_json: bool,
+        cache_key: Optional[str]
     ) -> str:
-        retry_count = 0
+        raw = json.dumps([self.api_url, message, temperature, is_json, cache_key], ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    async def _generate(
+        self,
+        message: Union[str, List[Dict]],
+        temperature: float,
+        max_retries: int,
+        is_json: bool,
+        cache_key: Optional[str],
+        priority: str
+    ) -> Any:
+        """发送请求，按重试策略重试；全部失败、熔断或未被准入时返回None"""
+        async def attempt():
+            response = await self.client.post(
+                self.api_url,
+                json=self._payload(message, temperature),
+                headers=self._headers()
+            )
+            
+            if response.status_code != 200:
+                raise APIStatusError("LLM", response.status_code)
+            
+            raw_response = response.json()["choices"][0]["message"]["content"].strip()
+            print("raw_response:", raw_response)
+            result = self._parse_json_response(raw_response) if is_json else raw_response
+            return raw_response, result
         
-        while retry_count < max_retries:
+        try:
+            # 每次尝试前排队等待准入名额，排队时间不计入LLM_REQUEST_DEADLINE
+            raw_response, result = await self._retry_policy(max_retries).run_async(
+                self.breaker, attempt, label="LLM请求", gate=lambda: self.admission.slot(priority)
+            )
+        except AdmissionError as e:
+            # 服务已经过载，重试只会加重负担
+            print(f"LLM请求未被准入({priority}): {str(e)}")
+            return None
+        except Exception as e:
+            print(f"LLM请求最终失败: {str(e)}")
+            return None
+        
+        if cache_key:
+            await run_blocking("cache", Config.CACHE_IO_MAX_WORKERS, get_llm_cache().put, cache_key, raw_response)
+        return result
+
+    def _cache_key(self, message: Union[str, List[Dict]], temperature: float) -> Optional[str]:
+        """可缓存时返回缓存键，否则返回None"""
+        cache = get_llm_cache()
+        if cache is None or (temperature != 0 and not Config.LLM_CACHE_ALL_TEMPERATURES):
+            return None
+        return cache.make_key(Config.LLM_MODEL, temperature, message)
+
+    async def forget_cached(self, message: Union[str, List[Dict]], temperature: float) -> None:
+        """删除某个提示词的缓存回复，用于调用方发现缓存的回复内容不可用时"""
+        cache_key = self._cache_key(message, temperature)
+        if cache_key:
+            await run_blocking("cache", Config.CACHE_IO_MAX_WORKERS, get_llm_cache().delete, cache_key)
+
+    async def stream_response(
+        self,
+        message: Union[str, List[Dict]],
+        temperature: float = 0.7,
+        max_retries: int = 3,
+        priority: str = "interactive"
+    ) -> AsyncIterator[str]:
+        """
+        以流式方式生成回复(OpenAI兼容的 stream: true)，逐个产出文本增量
+        只有在尚未产出任何内容时才会重试，避免重复输出；整个流式过程占用一个准入名额
+        """
+        policy = self._retry_policy(max_retries)
+        breaker = self.breaker
+        started = time.monotonic()
+        attempt = 0
+        
+        while True:
+            if not breaker.allow():
+                print("LLM服务已熔断，跳过流式请求")
+                return
+            emitted = False
             try:
-                async with httpx.AsyncClient(verify=False, timeout=120.0) as client:
-                    headers = {
-                        "Authorization": f"Bearer {self.api_key}",
-                        "Connection": "keep-alive",
-                        "Content-Type": "application/json"
-                    }
-                    
-                    response = await client.post(
+                queued_at = time.monotonic()
+                async with self.admission.slot(priority):
+                    # 排队等待准入名额的时间不计入截止时间
+                    started += time.monotonic() - queued_at
+                    async with self.client.stream(
+                        "POST",
                         self.api_url,
-                        json={
-                            "model": "claude-3-5-sonnet-20240620",
-                            "messages": [
-                                {
-                                    "role": "user", 
-                                    "content": message
-                                }
-                            ],
-                            "temperature": temperature,
-                        },
-                        headers={"Authorization": f"Bearer {self.api_key}"}
-                    )
-                    
-                    if response.status_code != 200:
-                        raise Exception(f"LLM API error: {response.status_code}")
-                    
-                    raw_response = response.json()["choices"][0]["message"]["content"].strip()
-                    print("raw_response:", raw_response)
-                    if is_json:
-                        return self._parse_json_response(raw_response)
-                    else:
-                        return raw_response
+                        json=self._payload(message, temperature, stream=True),
+                        headers=self._headers()
+                    ) as response:
+                        if response.status_code != 200:
+                            raise APIStatusError("LLM", response.status_code)
+                        breaker.record_success()
                         
+                        async for line in response.aiter_lines():
+                            line = line.strip()
+                            if not line.startswith("data:"):
+                                continue
+                            data = line[len("data:"):].strip()
+                            if data == "[DONE]":
+                                return
+                            
+                            choices = json.loads(data).get("choices") or []
+                            if not choices:
+                                continue
+                            delta = (choices[0].get("delta") or {}).get("content")
+                            if delta:
+                                emitted = True
+                                yield delta
+                        return
+            
+            except AdmissionError as e:
+                print(f"LLM请求未被准入({priority}): {str(e)}")
+                return
             except Exception as e:
-                retry_count += 1
-                print(f"LLM Error (attempt {retry_count}/{max_retries}): {str(e)}")
-                if retry_count < max_retries:
-                    await asyncio.sleep(1)
+                policy.record(breaker, e)
+                if emitted:
+                    print(f"LLM Stream Error (output already sent, not retrying): {str(e)}")
+                    return
+                delay = policy.next_delay(attempt, e, started)
+                if delay is None:
+                    print(f"LLM Stream Error (giving up after {attempt + 1} attempts): {str(e)}")
+                    return
+                attempt += 1
+                print(f"LLM Stream Error (retry {attempt} in {delay:.1f}s): {str(e)}")
+                await asyncio.sleep(delay)
                 
     @staticmethod
     def _parse_json_response(raw_response: str) -> Dict:
@@ -76,4 +315,73 @@ class LLMService:
                 raise ValueError("No valid JSON block found")
             except Exception as e:
                 raise ValueError(f"Failed to parse JSON response: {str(e)}")
-                
\ No newline at end of file
+
+
+class JSONStringFieldExtractor:
+    """
+    从正在生成的JSON文本中增量提取某个字符串字段的值
+    每次 feed 一段新文本，返回该字段新解码出来的部分
+    """
+    def __init__(self, field: str):
+        self._key_pattern = re.compile(r'"%s"\s*:\s*"' % re.escape(field))
+        self._buffer = ""
+        self._pos = None  # 字段值在buffer中的当前解析位置，None表示尚未找到字段
+        self.done = False
+        self.text = ""
+
+    def feed(self, chunk: str) -> str:
+        if self.done:
+            return ""
+        self._buffer += chunk
+        
+        if self._pos is None:
+            match = self._key_pattern.search(self._buffer)
+            if not match:
+                return ""
+            self._pos = match.end()
+        
+        decoded = []
+        buffer = self._buffer
+        pos = self._pos
+        while pos < len(buffer):
+            char = buffer[pos]
+            if char == '"':
+                self.done = True
+                pos += 1
+                break
+            if char != "\\":
+                decoded.append(char)
+                pos += 1
+                continue
+            
+            # 转义序列，内容不完整时等待下一段文本
+            escape = self._read_escape(buffer, pos)
+            if escape is None:
+                break
+            value, length = escape
+            decoded.append(value)
+            pos += length
+        
+        self._pos = pos
+        new_text = "".join(decoded)
+        self.text += new_text
+        return new_text
+
+    @staticmethod
+    def _read_escape(buffer: str, pos: int) -> Optional[tuple]:
+        """解析从pos开始的转义序列，返回(解码后的文本, 占用长度)"""
+        if pos + 1 >= len(buffer):
+            return None
+        if buffer[pos + 1] != "u":
+            return json.loads('"%s"' % buffer[pos:pos + 2]), 2
+        
+        if pos + 6 > len(buffer):
+            return None
+        code = int(buffer[pos + 2:pos + 6], 16)
+        # 代理对需要连同低位一起解码
+        if 0xD800 <= code <= 0xDBFF:
+            if pos + 12 > len(buffer):
+                return None
+            if buffer[pos + 6:pos + 8] == "\\u":
+                return json.loads('"%s"' % buffer[pos:pos + 12]), 12
+        return json.loads('"%s"' % buffer[pos:pos + 6]), 6
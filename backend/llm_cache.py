@@ -0,0 +1,54 @@
+import hashlib
+import json
+from typing import Dict, List, Optional, Union
+
+from config import Config
+from sqlite_cache import SQLiteLRUCache
+
+
+class LLMResponseCache(SQLiteLRUCache):
+    """
+    LLM回复缓存
+    键为(模型, temperature, 规范化提示词的哈希)，值为原始回复文本
+    """
+    def __init__(self, path: str, memory_size: int = 256, max_entries: int = 10000):
+        super().__init__(path, "responses", "response", memory_size, max_entries)
+
+    @staticmethod
+    def normalize(message: Union[str, List[Dict]]) -> str:
+        """
+        规范化提示词：统一换行符、去掉行尾空白和首尾空行，
+        只有这些差异的提示词(如重新上传时换行符变化)得到相同的键；不改变行内内容和大小写
+        """
+        def clean(text: str) -> str:
+            return "\n".join(line.rstrip() for line in text.splitlines()).strip("\n")
+
+        if isinstance(message, list):
+            return json.dumps(
+                [{**item, "content": clean(str(item.get("content", "")))} for item in message],
+                ensure_ascii=False, sort_keys=True
+            )
+        return clean(message)
+
+    @classmethod
+    def make_key(cls, model: str, temperature: float, message: Union[str, List[Dict]]) -> str:
+        digest = hashlib.sha256(cls.normalize(message).encode('utf-8')).hexdigest()
+        return f"{model}:{temperature}:{digest}"
+
+
+_caches: Dict[str, LLMResponseCache] = {}
+
+
+def get_llm_cache() -> Optional[LLMResponseCache]:
+    """获取全局共享的LLM回复缓存，未启用时返回None"""
+    if not Config.LLM_CACHE_ENABLED:
+        return None
+    cache = _caches.get(Config.LLM_CACHE_PATH)
+    if cache is None:
+        cache = LLMResponseCache(
+            Config.LLM_CACHE_PATH,
+            memory_size=Config.LLM_CACHE_MEMORY_SIZE,
+            max_entries=Config.LLM_CACHE_MAX_ENTRIES
+        )
+        _caches[Config.LLM_CACHE_PATH] = cache
+    return cache
@@ -5,25 +5,28 @@ from pydantic import BaseModel
 from typing import Optional
 import base64
 from chat_service import ChatService
+from llm import LLMService
+from executors import shutdown_executors
+from archive_queue import get_archive_queue
+from artifact_store import get_artifact_store
+from executors import run_blocking
+from job_queue import Job, get_job_queue
 from tts import TTSService
 from config import Config
 
 from fastapi import FastAPI, File, UploadFile
-import csv
-import io
 from fastapi.responses import StreamingResponse
+import json
 
 from fastapi import FastAPI, UploadFile, File, Form
 
-import shutil
-import uuid
 import os
 from fastapi import UploadFile, File, HTTPException
 from fastapi.responses import FileResponse
 from csv_service import CSVService
+from csv_stream import append_ok, stream_csv_transform
 
 # 添加导入
-from fastapi import Body
 from data_analysis_service import DataAnalysisService
 from pydantic import BaseModel
 from typing import Optional
@@ -50,30 +53,30 @@ class AnalyzeRequest(BaseModel):
 chat_service = ChatService()
 tts_service = TTSService(Config.FISH_API_KEY, Config.FISH_REFERENCE_ID)
 
-@app.post("/api/upload_csv")
-async def upload_csv(file: UploadFile = File(...)):
-    # 将上传的文件读取为文本
-    content = await file.read()
-    text_stream = io.StringIO(content.decode('utf-8', errors='ignore'))
-    
-    # 读取 CSV
-    reader = csv.reader(text_stream)
-    rows = list(reader)
-
-    # 在这里对 rows 做处理，如写入一些“填写”逻辑
-    # 简单示例：往每行最后一列补充“OK”
-    for row in rows:
-        row.append("OK")
+@app.on_event("startup")
+async def startup():
+    # 创建LLM共享连接池，所有服务复用长连接
+    await LLMService.startup([Config.LLM_API_URL, Config.EMBEDDING_API_URL])
+    get_archive_queue().start()
+    get_job_queue().start()
+    get_artifact_store().start()
+    chat_service.session_manager.start()
 
-    # 重新写出 CSV
-    output_stream = io.StringIO()
-    writer = csv.writer(output_stream)
-    writer.writerows(rows)
-    output_stream.seek(0)
+@app.on_event("shutdown")
+async def shutdown():
+    await chat_service.session_manager.stop()
+    await get_job_queue().stop()
+    await get_artifact_store().stop()
+    await get_archive_queue().stop()
+    await LLMService.shutdown()
+    shutdown_executors()
 
+@app.post("/api/upload_csv")
+async def upload_csv(file: UploadFile = File(...)):
+    """逐行读取上传的CSV，处理后边处理边返回，不把整个文件读入内存"""
     # 以附件形式返回填充好的 CSV
     return StreamingResponse(
-        output_stream,
+        stream_csv_transform(file, append_ok),
         media_type="text/csv",
         headers={
             "Content-Disposition": f"attachment; filename=filled_{file.filename}"
@@ -104,10 +107,94 @@ async def normal_chat_flow(request: ChatRequest):
         }
     )
 
+@app.post("/api/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """流式聊天接口(SSE)，先推送文本增量，最后推送表情、用户信息和语音"""
+    return StreamingResponse(
+        stream_chat_flow(request),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"
+        }
+    )
+
+async def stream_chat_flow(request: ChatRequest):
+    async for event in chat_service.stream_reply(request.message, request.session_id):
+        if event["type"] == "done":
+            print("-- /api/chat/stream --")
+            print("reply:", event["message"])
+            print("expression:", event["expression"])
+        if "audio" in event:
+            audio_data = event["audio"]
+            event["audio"] = base64.b64encode(audio_data).decode('ascii') if audio_data else ''
+        yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+
+async def run_csv_fill(job: Job, file_path: str, requirement: Optional[str]):
+    """后台任务：填写CSV空白单元格，按批次报告进度；上传文件的租约由upload_csv加上，这里负责释放"""
+    store = get_artifact_store()
+    output_path = store.output_path(file_path)
+    store.acquire(output_path)
+    try:
+        result = await csv_service.process_csv(
+            file_path,
+            requirement,
+            progress=lambda done, total: job.report(done, total, f"已填写{done}/{total}批"),
+            output_path=output_path
+        )
+    finally:
+        store.release(file_path, output_path)
+    
+    # 如果成功并且有输出文件，准备下载链接
+    if result["success"] and result["file_path"]:
+        # 提取文件名用于前端显示
+        result["download_filename"] = os.path.basename(result["file_path"])
+    return result
+
+async def run_csv_analysis(job: Job, file_path: str, requirement: Optional[str], refresh: bool):
+    """后台任务：分析CSV文件"""
+    store = get_artifact_store()
+    store.acquire(file_path)
+    try:
+        return await data_analysis_service.analyze_csv(file_path, requirement, refresh=refresh)
+    finally:
+        store.release(file_path)
+
+async def submit_job(kind: str, handler, *args, background: bool = False, leased: tuple = ()):
+    """
+    提交后台任务
+    background为True时立即返回任务ID，客户端通过/api/jobs查询进度和结果；否则等待任务结束后返回结果
+    leased为交给任务释放的文件租约，任务被拒绝时在这里释放
+    """
+    job = get_job_queue().submit(kind, handler, *args)
+    if job is None:
+        get_artifact_store().release(*leased)
+        return {
+            "success": False,
+            "message": "服务繁忙，请稍后再试"
+        }
+    if background:
+        return {
+            "success": True,
+            "job_id": job.id,
+            "status": job.status
+        }
+    await job.wait()
+    if job.status == "failed":
+        return {
+            "success": False,
+            "message": f"处理失败: {job.error}"
+        }
+    return job.result
 
 # 添加这个用于处理CSV文件上传的API路由
 @app.post("/api/upload-csv")
-async def upload_csv(file: UploadFile = File(...), requirement: Optional[str] = Form(None)):
+async def upload_csv(
+    file: UploadFile = File(...),
+    requirement: Optional[str] = Form(None),
+    background: bool = Form(False)
+):
     try:
         # 检查文件类型
         if not file.filename.endswith(".csv"):
@@ -116,29 +203,18 @@ async def upload_csv(file: UploadFile = File(...), requirement: Optional[str] =
                 "message": "只接受CSV文件格式"
             }
         
-        # 创建临时文件存储目录(如果不存在)
-        os.makedirs("temp", exist_ok=True)
-        
-        # 生成唯一文件名
+        # 保存上传文件，相同内容的文件只保存一份；保存时即加租约，任务排队期间不会被淘汰
         file_extension = os.path.splitext(file.filename)[1]
-        temp_file_name = f"{uuid.uuid4()}{file_extension}"
-        temp_file_path = os.path.join("temp", temp_file_name)
-        
-        # 保存上传文件
-        with open(temp_file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-            
-        # 处理CSV文件，传递填写要求
-        csv_service = CSVService()
-        result = await csv_service.process_csv(temp_file_path, requirement)
-        
-        # 如果成功并且有输出文件，准备下载链接
-        if result["success"] and result["file_path"]:
-            # 提取文件名用于前端显示
-            download_filename = os.path.basename(result["file_path"])
-            result["download_filename"] = download_filename
+        temp_file_path = await run_blocking(
+            "csv", Config.CSV_IO_MAX_WORKERS,
+            get_artifact_store().save_upload, file.file, file_extension, True
+        )
             
-        return result
+        # 提交填写任务，传递填写要求
+        return await submit_job(
+            "csv_fill", run_csv_fill, temp_file_path, requirement,
+            background=background, leased=(temp_file_path,)
+        )
     
     except Exception as e:
         print(f"CSV处理异常: {str(e)}")
@@ -148,33 +224,55 @@ async def upload_csv(file: UploadFile = File(...), requirement: Optional[str] =
             "success": False,
             "message": f"处理文件时出错: {str(e)}"
         }
-    
-    except Exception as e:
-        print(f"CSV处理异常: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        return {
-            "success": False,
-            "message": f"处理文件时出错: {str(e)}"
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    """查询后台任务的状态、进度和结果"""
+    job = get_job_queue().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在或已过期")
+    return job.to_dict()
+
+@app.get("/api/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """订阅后台任务进度(SSE)，任务结束后推送最终结果并关闭"""
+    job = get_job_queue().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在或已过期")
+    return StreamingResponse(
+        job_event_flow(job),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"
         }
+    )
+
+async def job_event_flow(job: Job):
+    while True:
+        version = job.version
+        yield f"data: {json.dumps(job.to_dict(), ensure_ascii=False)}\n\n"
+        if job.finished:
+            break
+        await job.wait_change(version, timeout=Config.JOB_EVENT_INTERVAL)
 
 # 添加这个用于提供文件下载的路由
 @app.get("/api/download/{filename}")
 async def download_file(filename: str):
-    try:
-        file_path = os.path.join("temp", filename)
-        
-        # 检查文件是否存在
-        if not os.path.exists(file_path):
-            raise HTTPException(status_code=404, detail="文件未找到")
-        
-        return FileResponse(
-            path=file_path, 
-            filename=filename,
-            media_type="text/csv"
-        )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"下载失败: {str(e)}")
+    store = get_artifact_store()
+    file_path = store.path(filename)
+    
+    # 检查文件是否存在
+    if file_path is None:
+        raise HTTPException(status_code=404, detail="文件未找到")
+    
+    store.touch(file_path)
+    # FileResponse分块发送文件并支持Range请求
+    return FileResponse(
+        path=file_path, 
+        filename=filename,
+        media_type="text/csv"
+    )
     
 
 # 添加这个用于分析CSV文件的API路由
@@ -183,6 +281,8 @@ async def analyze_csv(request: Dict[str, Any]):
     try:
         file_path = request.get("file_path")
         requirement = request.get("requirement")
+        refresh = bool(request.get("refresh", False))
+        background = bool(request.get("background", False))
         
         if not file_path:
             return {
@@ -190,9 +290,9 @@ async def analyze_csv(request: Dict[str, Any]):
                 "message": "缺少文件路径参数"
             }
         
-        data_analysis_service = DataAnalysisService()
-        result = await data_analysis_service.analyze_csv(file_path, requirement)
-        return result
+        return await submit_job(
+            "csv_analysis", run_csv_analysis, file_path, requirement, refresh, background=background
+        )
     except Exception as e:
         print(f"分析CSV异常: {str(e)}")
         import traceback
@@ -1,23 +1,53 @@
-from llm import LLMService
-from typing import List, Dict, Tuple
+from llm import LLMService, JSONStringFieldExtractor
+from typing import List, Dict, Tuple, AsyncIterator, Any, Callable, Optional, Set, Union
+import asyncio
 import os
+import time
 from datetime import datetime
+from config import Config
 from conversation import ConversationHistory
+from executors import run_blocking
+from prompt_builder import PromptBuilder
 
 class MainAgent:
-    def __init__(self, llm_service: LLMService, conversation_history: ConversationHistory):
+    def __init__(
+        self,
+        llm_service: LLMService,
+        conversation_history: ConversationHistory,
+        user_info_file: str = './save/me.txt'
+    ):
         self.conversation_history = conversation_history
         self.llm_service = llm_service
         with open('./prompts/reply.txt', 'r', encoding='utf-8') as file:
             self.prompt_template = file.read()
+        self.prompt_builder = self._create_prompt_builder()
             
         # 确保日志和个人信息目录存在
         self.log_dir = './save/log'
         os.makedirs(self.log_dir, exist_ok=True)
         
-        # 读取个人信息文件
-        self.user_info_file = './save/me.txt'
-        self.user_info = self._load_user_info()
+        # 个人信息文件在第一次回复时和记忆检索并行读取
+        self.user_info_file = user_info_file
+        os.makedirs(os.path.dirname(self.user_info_file), exist_ok=True)
+        self.user_info: Optional[str] = None
+        
+        # 日志、归档等后台任务，保留引用避免被回收
+        self._background_tasks: Set[asyncio.Task] = set()
+        # 最近一次回复各阶段耗时(毫秒)和prompt各部分的token数
+        self.last_timings: Dict[str, float] = {}
+        self.last_prompt_tokens: Dict[str, int] = {}
+
+    def _run_in_background(self, executor: str, func: Callable, *args) -> None:
+        """把阻塞操作放到后台线程池执行，不等待结果"""
+        max_workers = 1 if executor == "log" else Config.MEMORY_MAX_WORKERS
+        task = asyncio.get_running_loop().create_task(run_blocking(executor, max_workers, func, *args))
+        self._background_tasks.add(task)
+        task.add_done_callback(self._on_background_done)
+
+    def _on_background_done(self, task: asyncio.Task) -> None:
+        self._background_tasks.discard(task)
+        if not task.cancelled() and task.exception():
+            print(f"后台任务出错: {task.exception()}")
 
     def _log_conversation(self, role: str, content: str) -> None:
         """记录对话到日志文件"""
@@ -25,20 +55,45 @@ class MainAgent:
         current_time = datetime.now().strftime('%H:%M:%S')
         log_file = os.path.join(self.log_dir, f'{current_date}.txt')
         
+        session_id = self.conversation_history.session_id
+        session_tag = '' if session_id == 'default' else f' ({session_id})'
         with open(log_file, 'a', encoding='utf-8') as f:
-            f.write(f'[{current_time}] {role.capitalize()}: {content}\n')
+            f.write(f'[{current_time}]{session_tag} {role.capitalize()}: {content}\n')
         
+    async def _prepare(self, message: str) -> str:
+        """
+        回复前的准备：用户消息日志放到后台写入，
+        记忆检索和个人信息读取并行执行，返回记忆文本
+        """
+        self.last_timings = {}
+        self._run_in_background("log", self._log_conversation, 'user', message)
+        
+        started = time.perf_counter()
+        memory_text, _ = await asyncio.gather(
+            self._get_relevant_memories(message),
+            self._ensure_user_info()
+        )
+        self.last_timings["retrieval"] = (time.perf_counter() - started) * 1000
+        print("相关记忆:", memory_text)
+        return memory_text
+
+    def _finish_timings(self, started: float, llm_started: float) -> None:
+        now = time.perf_counter()
+        self.last_timings["llm"] = (now - llm_started) * 1000
+        self.last_timings["total"] = (now - started) * 1000
+        print("各阶段耗时(ms):", {stage: round(cost, 1) for stage, cost in self.last_timings.items()})
+
     async def reply(self, message: str) -> Tuple[str, str]:
         """生成回复"""
-        # 记录用户消息
-        self._log_conversation('user', message)
+        started = time.perf_counter()
         
         # 获取相关记忆
-        memory_text = self._get_relevant_memories(message)
-        print("相关记忆:", memory_text)
+        memory_text = await self._prepare(message)
         
         # 生成回复
+        llm_started = time.perf_counter()
         reply_content, expression = await self._generate_reply(message, memory_text)
+        self._finish_timings(started, llm_started)
         
         # 处理回复
         if reply_content:
@@ -46,38 +101,113 @@ class MainAgent:
             
         return reply_content, expression
 
-    async def _generate_reply(self, message: str, memory_text: str = "无补充信息") -> Tuple[str, str]:
-        """生成回复的核心方法"""
-        # 准备prompt
-        context = self.conversation_history.get_context()
-        prompt = self.prompt_template.format(
-            chat_history=context,
+    async def reply_stream(self, message: str) -> AsyncIterator[Dict[str, Any]]:
+        """
+        流式生成回复
+        先逐段产出 {"type": "delta", "content": ...}，
+        结束时产出 {"type": "done", "message": ..., "expression": ..., "user_info": ..., "timings": ..., "prompt_tokens": ...}
+        """
+        started = time.perf_counter()
+        memory_text = await self._prepare(message)
+        
+        prompt = self._build_prompt(message, memory_text)
+        
+        # 从模型正在生成的JSON中增量提取reply字段
+        llm_started = time.perf_counter()
+        extractor = JSONStringFieldExtractor("reply")
+        chunks = []
+        async for delta in self.llm_service.stream_response(prompt):
+            if not chunks:
+                self.last_timings["first_token"] = (time.perf_counter() - started) * 1000
+            chunks.append(delta)
+            text = extractor.feed(delta)
+            if text:
+                yield {"type": "delta", "content": text}
+        
+        raw_response = "".join(chunks).strip()
+        print("raw_response:", raw_response)
+        try:
+            reply = LLMService._parse_json_response(raw_response) if raw_response else None
+        except ValueError as e:
+            print(f"解析流式回复失败: {e}")
+            # JSON不完整时，以已经发给前端的内容为准
+            reply = {"reply": extractor.text} if extractor.text else None
+        
+        reply_content, expression = self._apply_reply(reply)
+        self._finish_timings(started, llm_started)
+        if reply_content:
+            self._handle_successful_reply(message, reply_content)
+        
+        yield {
+            "type": "done",
+            "message": reply_content,
+            "expression": expression,
+            "user_info": self.user_info,
+            "timings": self.last_timings,
+            "prompt_tokens": self.last_prompt_tokens
+        }
+
+    def _create_prompt_builder(self) -> PromptBuilder:
+        if Config.PROMPT_LAYOUT != "chat":
+            return PromptBuilder(self.prompt_template)
+        
+        # system消息由reply.txt生成，人设只维护一份
+        with open('./prompts/reply_turn.txt', 'r', encoding='utf-8') as file:
+            turn_template = file.read()
+        return PromptBuilder(
+            self.prompt_template,
+            layout="chat",
+            turn_template=turn_template
+        )
+
+    def _build_prompt(self, message: str, memory_text: str) -> Union[str, List[Dict[str, str]]]:
+        """按token预算准备prompt，chat布局下返回消息列表"""
+        prompt, self.last_prompt_tokens = self.prompt_builder.build(
+            history=[(turn.ask, turn.answer) for turn in self.conversation_history.turns],
             user_message=message,
             memory=memory_text,
-            user_info=self.user_info
+            user_info=self.user_info or ""
         )
-        
-        # 获取LLM回复
-        reply = await self.llm_service.generate_response(prompt, is_json=True)
+        print("prompt token数:", self.last_prompt_tokens)
+        return prompt
+
+    def _apply_reply(self, reply: Dict) -> Tuple[str, str]:
+        """处理模型返回的JSON，更新用户信息并返回(回复, 表情)"""
         if not reply:
             return "对不起，我现在有点累了，能稍后再聊吗？", "生气"
         
         # 检查是否有用户信息更新
         if "user_info" in reply:
-            self._save_user_info(reply["user_info"])
             self.user_info = reply["user_info"]
+            self._run_in_background("log", self._save_user_info, reply["user_info"])
         
         return reply.get("reply", ""), reply.get("expression", "")
 
-    def _get_relevant_memories(self, message: str) -> str:
+    async def _generate_reply(self, message: str, memory_text: str = "无补充信息") -> Tuple[str, str]:
+        """生成回复的核心方法"""
+        prompt = self._build_prompt(message, memory_text)
+        
+        # 获取LLM回复
+        reply = await self.llm_service.generate_response(prompt, is_json=True)
+        return self._apply_reply(reply)
+
+    async def _get_relevant_memories(self, message: str) -> str:
         """获取相关记忆"""
-        memories = self.conversation_history.retrieve(message, n_results=2)
+        memories = await self.conversation_history.aretrieve(message)
         return "\n".join(memories) if memories else "无补充信息"
 
     def _handle_successful_reply(self, message: str, reply_content: str) -> None:
-        """处理成功的回复"""
-        self._log_conversation('assistant', reply_content)
-        self.conversation_history.add_dialog(message, reply_content)
+        """处理成功的回复：对话立即进入缓冲区，日志和归档在后台完成"""
+        self._run_in_background("log", self._log_conversation, 'assistant', reply_content)
+        self.conversation_history.add_dialog(message, reply_content, auto_archive=False)
+        
+        # 超出上限的对话进入后台归档队列
+        self.conversation_history.queue_archive(self.conversation_history.take_archive_batch())
+
+    async def _ensure_user_info(self) -> None:
+        """第一次使用时在后台线程读取个人信息"""
+        if self.user_info is None:
+            self.user_info = await run_blocking("memory", Config.MEMORY_MAX_WORKERS, self._load_user_info)
 
     def _load_user_info(self) -> str:
         """加载用户个人信息"""
@@ -0,0 +1,132 @@
+from typing import Any, Dict, List, Tuple
+
+from config import Config
+from tokens import count_tokens, truncate_to_tokens
+
+
+class MemoryIndexer:
+    """
+    按轮次切分的记忆索引
+    归档时每轮对话单独存为一个chunk(可选带上前几轮作为窗口)，元数据包含时间、会话和轮次序号；
+    检索时取最相关的top-k个chunk，合并相邻轮次，并按token预算截断
+    """
+    def __init__(
+        self,
+        window: int = Config.MEMORY_CHUNK_WINDOW,
+        top_k: int = Config.MEMORY_TOP_K,
+        neighbor_turns: int = Config.MEMORY_NEIGHBOR_TURNS,
+        max_tokens: int = Config.MEMORY_MAX_TOKENS
+    ):
+        self.window = max(1, window)
+        self.top_k = top_k
+        self.neighbor_turns = neighbor_turns
+        self.max_tokens = max_tokens
+
+    @staticmethod
+    def format_turn(turn: Dict[str, str]) -> str:
+        return f"user: {turn['ask']}\nassistant: {turn['answer']}"
+
+    def build_chunks(
+        self,
+        turns: List[Dict[str, str]],
+        session_id: str,
+        first_turn_index: int,
+        id_prefix: str
+    ) -> List[Tuple[str, str, Dict[str, Any]]]:
+        """把一批对话切分成chunk，返回[(id, 用于embedding的文本, 元数据)]"""
+        chunks = []
+        for offset, turn in enumerate(turns):
+            window_turns = turns[max(0, offset - self.window + 1):offset + 1]
+            turn_text = self.format_turn(turn)
+            chunks.append((
+                f"{id_prefix}-{offset}",
+                "\n".join(self.format_turn(item) for item in window_turns),
+                {
+                    "timestamp": turn["timestamp"],
+                    "session_id": session_id,
+                    "turn_index": first_turn_index + offset,
+                    "turn_text": turn_text
+                }
+            ))
+        return chunks
+
+    def retrieve(self, collection, embedding: List[float], session_id: str) -> List[str]:
+        """检索相关记忆，返回按相关度排序、合并相邻轮次后的记忆片段"""
+        results = collection.query(
+            query_embeddings=[embedding],
+            n_results=self.top_k,
+            include=['documents', 'metadatas']
+        )
+        if not results['documents'] or not results['documents'][0]:
+            return []
+        
+        documents = results['documents'][0]
+        metadatas = (results.get('metadatas') or [[None] * len(documents)])[0]
+        
+        # 命中的轮次按相关度排列，旧版整段归档的文档没有轮次序号，原样保留
+        hits: List[Any] = []
+        for document, metadata in zip(documents, metadatas):
+            if metadata and "turn_index" in metadata:
+                hits.append(int(metadata["turn_index"]))
+            else:
+                hits.append(document)
+        
+        turn_texts = self._load_turns(collection, session_id, [hit for hit in hits if isinstance(hit, int)])
+        
+        blocks = []
+        used = set()
+        for hit in hits:
+            if not isinstance(hit, int):
+                blocks.append(hit)
+                continue
+            if hit in used:
+                continue
+            # 从命中轮次向两侧扩展连续的相邻轮次
+            start, end = hit, hit
+            while start - 1 in turn_texts and start - 1 not in used and hit - start < self.neighbor_turns:
+                start -= 1
+            while end + 1 in turn_texts and end + 1 not in used and end - hit < self.neighbor_turns:
+                end += 1
+            indexes = [index for index in range(start, end + 1) if index in turn_texts]
+            used.update(indexes)
+            blocks.append("\n".join(turn_texts[index] for index in indexes))
+        
+        return self._apply_budget(blocks)
+
+    def _load_turns(self, collection, session_id: str, hit_indexes: List[int]) -> Dict[int, str]:
+        """读取命中轮次及其相邻轮次的原文"""
+        if not hit_indexes:
+            return {}
+        wanted = sorted({
+            index + delta
+            for index in hit_indexes
+            for delta in range(-self.neighbor_turns, self.neighbor_turns + 1)
+        })
+        records = collection.get(
+            where={"$and": [
+                {"session_id": session_id},
+                {"turn_index": {"$in": wanted}}
+            ]},
+            include=['metadatas']
+        )
+        return {
+            int(metadata["turn_index"]): metadata.get("turn_text", "")
+            for metadata in records.get('metadatas') or []
+            if metadata and "turn_index" in metadata
+        }
+
+    def _apply_budget(self, blocks: List[str]) -> List[str]:
+        """按相关度顺序保留记忆片段，总token数不超过预算"""
+        kept = []
+        remaining = self.max_tokens
+        for block in blocks:
+            if remaining <= 0:
+                break
+            tokens = count_tokens(block)
+            if tokens > remaining:
+                block = truncate_to_tokens(block, remaining, counter=count_tokens)
+                tokens = remaining
+            if block:
+                kept.append(block)
+            remaining -= tokens
+        return kept
@@ -0,0 +1,208 @@
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+_ISO_DATE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
+
+class PrefillEngine:
+    """
+    本地预填写：在调用模型前用规则和统计方法推断空白单元格，每个结果附带置信度
+    依次尝试函数依赖(如姓名 -> 部门)、等差数列/等间隔日期、常量列、前后值相同的连续段、插值、众数/中位数，
+    同一单元格取置信度最高的结果；置信度不低于min_confidence的直接填写，其余交给模型
+    """
+    SEQUENCE_MIN_POINTS = 5  # 判定为等差数列至少需要的已知值个数
+
+    def __init__(self, min_confidence: float = 0.85, min_dependency_consistency: float = 0.9):
+        self.min_confidence = min_confidence
+        self.min_dependency_consistency = min_dependency_consistency
+
+    def suggest(self, df: pd.DataFrame) -> List[Dict[str, Any]]:
+        """返回所有能推断的单元格[{row, column, content, confidence, method}]"""
+        suggestions = []
+        keys = self._key_candidates(df)
+        for column in df.columns:
+            series = df[column]
+            blank = series.isna()
+            if not blank.any() or not (~blank).any():
+                continue
+            
+            best_value = pd.Series(None, index=series.index[blank], dtype=object)
+            best_confidence = pd.Series(0.0, index=best_value.index)
+            best_method = pd.Series(None, index=best_value.index, dtype=object)
+            for method, strategy in (
+                ("dependency", lambda df, column, blank: self._dependency(df, column, blank, keys)),
+                ("sequence", self._sequence),
+                ("constant", self._constant),
+                ("run", self._runs),
+                ("interpolate", self._interpolate),
+                ("statistic", self._statistic)
+            ):
+                result = strategy(df, column, blank)
+                if result is None:
+                    continue
+                values, confidence = result
+                better = confidence.reindex(best_confidence.index).fillna(0) > best_confidence
+                better &= values.reindex(best_value.index).notna()
+                best_value[better] = values.reindex(best_value.index)[better]
+                best_confidence[better] = confidence.reindex(best_confidence.index)[better]
+                best_method[better] = method
+            
+            found = best_method.notna()
+            suggestions.extend(
+                {
+                    "row": int(row),
+                    "column": column,
+                    "content": self._native(value),
+                    "confidence": round(float(confidence), 3),
+                    "method": method
+                }
+                for row, value, confidence, method in zip(
+                    best_value.index[found], best_value[found], best_confidence[found], best_method[found]
+                )
+            )
+        return suggestions
+
+    def split(self, suggestions: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """按置信度分为(直接填写, 交给模型)两部分"""
+        accepted = [cell for cell in suggestions if cell["confidence"] >= self.min_confidence]
+        uncertain = [cell for cell in suggestions if cell["confidence"] < self.min_confidence]
+        return accepted, uncertain
+
+    @staticmethod
+    def _native(value: Any) -> Any:
+        if isinstance(value, (np.integer, np.floating)):
+            value = value.item()
+        if isinstance(value, float) and value.is_integer():
+            return int(value)
+        return value
+
+    @staticmethod
+    def _key_candidates(df: pd.DataFrame) -> List[str]:
+        """可作为函数依赖左侧的列：非浮点数，且取值有重复(不同值数不超过非空值数的一半)"""
+        keys = []
+        for column in df.columns:
+            series = df[column]
+            if pd.api.types.is_float_dtype(series):
+                continue
+            count = int(series.notna().sum())
+            if count and series.nunique(dropna=True) <= count / 2:
+                keys.append(column)
+        return keys
+
+    def _dependency(
+        self,
+        df: pd.DataFrame,
+        column: str,
+        blank: pd.Series,
+        keys: List[str]
+    ) -> Optional[Tuple[pd.Series, pd.Series]]:
+        """
+        函数依赖：找到另一列key，使已知数据中相同key(出现至少两次)对应的column值都相同，
+        空白行按key查表；查到的key出现多次时置信度更高
+        """
+        known = df[~blank]
+        best = None
+        for key in keys:
+            if key == column:
+                continue
+            groups = known.groupby(key, dropna=True)[column]
+            counts = groups.size()
+            repeated = counts >= 2
+            if not repeated.any():
+                continue
+            consistent = groups.nunique() == 1
+            consistency = counts[repeated & consistent].sum() / counts[repeated].sum()
+            if consistency < self.min_dependency_consistency:
+                continue
+            if best is not None and consistency <= best[0]:
+                continue
+            mapping = groups.first()[consistent]
+            blank_keys = df.loc[blank, key]
+            values = blank_keys.map(mapping)
+            support = blank_keys.map(counts).fillna(0)
+            confidence = pd.Series(np.where(support >= 2, 0.95, 0.75) * consistency, index=blank_keys.index)
+            best = (consistency, values, confidence.where(values.notna(), 0.0))
+        return best[1:] if best else None
+
+    def _sequence(self, df: pd.DataFrame, column: str, blank: pd.Series) -> Optional[Tuple[pd.Series, pd.Series]]:
+        """
+        已知值(至少SEQUENCE_MIN_POINTS个)按行号构成等差数列(数值)或等间隔日期时按公差推算
+        只有已知范围内的空白置信度较高，范围外的外推置信度较低，交给模型确认
+        """
+        series = df[column]
+        known = series[~blank]
+        if len(known) < self.SEQUENCE_MIN_POINTS:
+            return None
+        
+        is_date = False
+        if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+            y = known.to_numpy(dtype=float)
+        elif known.astype(str).str.match(_ISO_DATE).all():
+            dates = pd.to_datetime(known, format="%Y-%m-%d", errors="coerce")
+            if dates.isna().any():
+                return None
+            y = dates.to_numpy(dtype="datetime64[ns]").astype(np.int64).astype(float)
+            is_date = True
+        else:
+            return None
+        
+        positions = np.flatnonzero(~blank.to_numpy())
+        steps = np.diff(y) / np.diff(positions)
+        if not np.allclose(steps, steps[0]):
+            return None
+        
+        blank_positions = np.flatnonzero(blank.to_numpy())
+        filled = y[0] + steps[0] * (blank_positions - positions[0])
+        inside = (blank_positions > positions[0]) & (blank_positions < positions[-1])
+        confidence = pd.Series(np.where(inside, 0.95, 0.6), index=series.index[blank])
+        if is_date:
+            values = pd.Series(pd.to_datetime(filled.astype(np.int64)).strftime("%Y-%m-%d"), index=confidence.index)
+        else:
+            values = pd.Series(filled, index=confidence.index)
+        return values, confidence
+
+    def _constant(self, df: pd.DataFrame, column: str, blank: pd.Series) -> Optional[Tuple[pd.Series, pd.Series]]:
+        """已知值(至少3个)全部相同"""
+        known = df.loc[~blank, column]
+        if len(known) < 3 or known.nunique() != 1:
+            return None
+        index = df.index[blank]
+        return pd.Series(known.iloc[0], index=index), pd.Series(0.9, index=index)
+
+    def _runs(self, df: pd.DataFrame, column: str, blank: pd.Series) -> Optional[Tuple[pd.Series, pd.Series]]:
+        """
+        前向/后向填充：列中相邻已知值经常相同(按连续段排列)时，
+        空白前后值相同则置信度较高，只有一侧或两侧不同时置信度较低
+        """
+        series = df[column]
+        known = series[~blank]
+        if len(known) < 2:
+            return None
+        run_ratio = float((known.to_numpy()[1:] == known.to_numpy()[:-1]).mean())
+        previous = series.ffill()[blank]
+        following = series.bfill()[blank]
+        same = (previous == following).fillna(False).astype(bool)
+        values = previous.where(previous.notna(), following)
+        confidence = pd.Series(np.where(same, 0.6 + 0.35 * run_ratio, 0.5 * run_ratio), index=values.index)
+        return values, confidence
+
+    def _interpolate(self, df: pd.DataFrame, column: str, blank: pd.Series) -> Optional[Tuple[pd.Series, pd.Series]]:
+        """数值列在前后已知值之间线性插值，置信度较低"""
+        series = df[column]
+        if not pd.api.types.is_numeric_dtype(series) or pd.api.types.is_bool_dtype(series):
+            return None
+        values = series.astype(float).interpolate(method="linear", limit_area="inside")[blank]
+        return values, pd.Series(0.6, index=values.index).where(values.notna(), 0.0)
+
+    def _statistic(self, df: pd.DataFrame, column: str, blank: pd.Series) -> Optional[Tuple[pd.Series, pd.Series]]:
+        """兜底：数值列用中位数，其余用众数，置信度随众数占比变化"""
+        series = df[column]
+        index = df.index[blank]
+        if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+            return pd.Series(series.median(), index=index), pd.Series(0.3, index=index)
+        counts = series.value_counts(dropna=True)
+        share = counts.iloc[0] / counts.sum()
+        return pd.Series(counts.index[0], index=index), pd.Series(0.5 * share, index=index)
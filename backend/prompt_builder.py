@@ -0,0 +1,172 @@
+import json
+from typing import Dict, List, Optional, Tuple
+
+from config import Config
+from tokens import count_tokens, truncate_to_tokens
+
+
+class PromptBuilder:
+    """
+    按token预算组装回复prompt
+    用户消息始终完整保留；超出预算时依次裁剪：较早的对话记录、相关记忆、用户信息，
+    最后把对话记录裁剪到只剩最近一轮。返回prompt和各部分的token数
+
+    layout为"single"时沿用reply.txt，把所有内容放进一条用户消息；
+    为"chat"时人设放在固定的system消息里，对话记录按轮追加为user/assistant消息，
+    用户信息和记忆放在最后一条用户消息中，使前缀在轮次之间保持不变，便于本地推理服务复用前缀缓存；
+    超出预算时对话记录一次裁到保留轮数，之后从保留的最早一轮开始追加，直到再次超出预算前前缀都不变
+    """
+    TRUNCATED = "(已省略)"
+    # chat布局的system消息由reply.txt去掉"任务输入"部分得到，换成下面的说明
+    INPUT_START = "任务输入:"
+    INPUT_END = "任务输出:"
+    CHAT_INPUT_NOTE = (
+        "之前的对话记录会按顺序出现在消息中，你的历史回复只保留了reply字段，本轮仍须输出完整的JSON。"
+        "每轮用户消息会附带用户的个人信息和相关记忆。"
+    )
+
+    def __init__(
+        self,
+        template: str,
+        max_tokens: int = Config.PROMPT_MAX_TOKENS,
+        min_history_turns: int = Config.PROMPT_MIN_HISTORY_TURNS,
+        layout: str = "single",
+        turn_template: Optional[str] = None
+    ):
+        self.template = template
+        self.max_tokens = max_tokens
+        self.min_history_turns = min_history_turns
+        self.layout = layout
+        self.system_prompt = self.chat_system_prompt(template) if layout == "chat" else None
+        self.turn_template = turn_template
+        # chat布局上一次保留的最早一轮对话，下次从这一轮开始，使前缀保持不变
+        self._history_start: Optional[Tuple[str, str]] = None
+        
+        if layout == "chat":
+            self.template_tokens = count_tokens(self.system_prompt) + count_tokens(turn_template.format(
+                user_message="", memory="", user_info=""
+            ))
+        else:
+            self.template_tokens = count_tokens(template.format(
+                chat_history="", user_message="", memory="", user_info=""
+            ))
+
+    @classmethod
+    def chat_system_prompt(cls, template: str) -> str:
+        """从single布局的模板生成chat布局的system消息：人设和输出要求不变，输入部分改为说明"""
+        head, rest = template.split(cls.INPUT_START, 1)
+        tail = rest.split(cls.INPUT_END, 1)[1]
+        # 剩下的部分没有占位符，format()只把{{ }}还原为{ }
+        return (head + cls.CHAT_INPUT_NOTE + "\n\n" + cls.INPUT_END + tail).format()
+
+    def build(
+        self,
+        history: List[Tuple[str, str]],
+        user_message: str,
+        memory: str,
+        user_info: str
+    ):
+        """
+        history为[(用户消息, 助手回复)]，按时间顺序排列
+        返回(prompt, 各部分token数)，chat布局下prompt为消息列表
+        """
+        if self.layout == "chat":
+            # 从上次保留的最早一轮开始，已裁掉的对话不再回到prompt中
+            if self._history_start in history:
+                history = history[history.index(self._history_start):]
+            history_texts = [ask + self._assistant_content(answer) for ask, answer in history]
+        else:
+            history_texts = [self._format_turn(ask, answer) for ask, answer in history]
+        history_tokens = [count_tokens(text) + 1 for text in history_texts]
+        memory_tokens = count_tokens(memory)
+        user_info_tokens = count_tokens(user_info)
+        available = self.max_tokens - self.template_tokens - count_tokens(user_message)
+        
+        def total() -> int:
+            return sum(history_tokens) + memory_tokens + user_info_tokens
+        
+        def trim_history(keep: int) -> None:
+            # chat布局一次裁到keep轮，避免每轮都丢掉最早一轮使前缀缓存失效；single布局逐轮丢弃，尽量多保留对话
+            nonlocal history, history_tokens
+            while total() > available and len(history) > keep:
+                drop = len(history) - keep if self.layout == "chat" else 1
+                history, history_tokens = history[drop:], history_tokens[drop:]
+        
+        # 1. 丢弃较早的对话，至少保留最近min_history_turns轮
+        trim_history(self.min_history_turns)
+        
+        # 2. 裁剪相关记忆(记忆按相关度排列，保留开头)
+        if total() > available:
+            memory = self._truncate(memory, available - (total() - memory_tokens))
+            memory_tokens = count_tokens(memory)
+        
+        # 3. 裁剪用户信息
+        if total() > available:
+            user_info = self._truncate(user_info, available - (total() - user_info_tokens))
+            user_info_tokens = count_tokens(user_info)
+        
+        # 4. 继续丢弃对话，只保留最近一轮
+        trim_history(1)
+        
+        if self.layout == "chat":
+            self._history_start = history[0] if history else None
+            prompt = self._build_messages(history, user_message, memory, user_info)
+        else:
+            prompt = self.template.format(
+                chat_history="\n".join(self._format_turn(ask, answer) for ask, answer in history),
+                user_message=user_message,
+                memory=memory,
+                user_info=user_info
+            )
+        
+        report = {
+            "template": self.template_tokens,
+            "user_message": count_tokens(user_message),
+            "chat_history": sum(history_tokens),
+            "history_turns": len(history),
+            "memory": memory_tokens,
+            "user_info": user_info_tokens
+        }
+        report["total"] = (report["template"] + report["user_message"] + report["chat_history"]
+                           + report["memory"] + report["user_info"])
+        return prompt, report
+
+    def _build_messages(
+        self,
+        history: List[Tuple[str, str]],
+        user_message: str,
+        memory: str,
+        user_info: str
+    ) -> List[Dict[str, str]]:
+        """chat布局：固定的system消息 + 按轮追加的历史 + 最新一轮(含用户信息和记忆)"""
+        messages = [{"role": "system", "content": self.system_prompt}]
+        for ask, answer in history:
+            messages.append({"role": "user", "content": ask})
+            messages.append({"role": "assistant", "content": self._assistant_content(answer)})
+        messages.append({
+            "role": "user",
+            "content": self.turn_template.format(
+                user_message=user_message,
+                memory=memory,
+                user_info=user_info
+            )
+        })
+        return messages
+
+    @staticmethod
+    def _assistant_content(answer: str) -> str:
+        """历史回复按输出格式(JSON)回放，避免模型模仿纯文本回复"""
+        return json.dumps({"reply": answer}, ensure_ascii=False)
+
+    @staticmethod
+    def _format_turn(ask: str, answer: str) -> str:
+        return f"user: {ask}\nassistant: {answer}"
+
+    def _truncate(self, text: str, max_tokens: int) -> str:
+        if max_tokens <= count_tokens(self.TRUNCATED):
+            return self.TRUNCATED if text else ""
+        return truncate_to_tokens(
+            text,
+            max_tokens - count_tokens(self.TRUNCATED),
+            counter=count_tokens
+        ) + self.TRUNCATED
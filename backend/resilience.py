@@ -0,0 +1,209 @@
+import asyncio
+import random
+import threading
+import time
+from contextlib import nullcontext
+from typing import Any, AsyncContextManager, Awaitable, Callable, Dict, Optional
+
+import httpx
+
+from config import Config
+
+# 可以重试的HTTP状态码：超时、限流和服务端临时错误
+RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504}
+
+
+class APIStatusError(Exception):
+    """后端返回了非200状态码"""
+    def __init__(self, service: str, status_code: int):
+        super().__init__(f"{service} API error: {status_code}")
+        self.status_code = status_code
+
+
+class NonRetryableError(Exception):
+    """不应重试、也不说明后端状态的错误"""
+
+
+class CircuitOpenError(NonRetryableError):
+    """熔断器处于打开状态，请求被直接拒绝"""
+
+
+class DeadlineExceeded(NonRetryableError):
+    """超过了整个请求(含重试)的截止时间"""
+
+
+def is_retryable(error: BaseException) -> bool:
+    """状态码错误只重试RETRYABLE_STATUS，熔断、超过截止时间等不重试，其余(网络错误、回复格式错误等)重试"""
+    if isinstance(error, APIStatusError):
+        return error.status_code in RETRYABLE_STATUS
+    return not isinstance(error, NonRetryableError)
+
+
+def is_backend_failure(error: BaseException) -> bool:
+    """是否说明后端不可用(计入熔断)：网络错误、超时和可重试的状态码；回复格式错误等说明后端仍可用"""
+    if isinstance(error, APIStatusError):
+        return error.status_code in RETRYABLE_STATUS
+    return isinstance(error, (httpx.TransportError, ConnectionError, TimeoutError))
+
+
+def backoff_delay(attempt: int, base_delay: float, max_delay: float) -> float:
+    """指数退避加全抖动：在[0, min(max_delay, base_delay * 2^attempt)]中随机取值，避免重试同时涌向后端"""
+    return random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+
+
+class CircuitBreaker:
+    """
+    熔断器
+    连续失败failure_threshold次后打开，reset_timeout秒内的请求直接失败；
+    之后放行一个探测请求(半开)，成功则关闭，失败则重新打开；探测请求没有结果时每隔reset_timeout秒再放行一个
+    """
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = "half_open"
+                self._opened_at = time.monotonic()
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = "closed"
+            self._failures = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self.state == "half_open" or self._failures >= self.failure_threshold:
+                if self.state != "open":
+                    print(f"{self.name}连续失败{self._failures}次，熔断{self.reset_timeout}秒")
+                self.state = "open"
+                self._opened_at = time.monotonic()
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    """获取某个后端(服务地址)的熔断器，同一后端的所有调用共用"""
+    with _breakers_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(
+                name,
+                failure_threshold=Config.CIRCUIT_FAILURE_THRESHOLD,
+                reset_timeout=Config.CIRCUIT_RESET_TIMEOUT
+            )
+        return _breakers[name]
+
+
+class RetryPolicy:
+    """
+    重试策略：最多重试max_retries次，每次等待指数退避加抖动的时间，只重试可重试的错误，
+    所有尝试(含等待)不超过deadline秒；每次尝试前检查熔断器，结果计入熔断器
+    """
+    def __init__(
+        self,
+        max_retries: int = 3,
+        base_delay: float = Config.RETRY_BASE_DELAY,
+        max_delay: float = Config.RETRY_MAX_DELAY,
+        deadline: Optional[float] = None
+    ):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+
+    @staticmethod
+    def record(breaker: CircuitBreaker, error: BaseException) -> None:
+        """把一次失败计入熔断器：后端不可用计为失败，后端有回复(如格式错误)计为成功"""
+        if is_backend_failure(error):
+            breaker.record_failure()
+        elif not isinstance(error, NonRetryableError):
+            breaker.record_success()
+
+    def next_delay(self, attempt: int, error: BaseException, started: float) -> Optional[float]:
+        """下一次重试前的等待时间，不再重试时返回None"""
+        if attempt >= self.max_retries or not is_retryable(error):
+            return None
+        delay = backoff_delay(attempt, self.base_delay, self.max_delay)
+        if self.deadline is not None and time.monotonic() - started + delay >= self.deadline:
+            return None
+        return delay
+
+    def _remaining(self, started: float) -> Optional[float]:
+        if self.deadline is None:
+            return None
+        remaining = self.deadline - (time.monotonic() - started)
+        if remaining <= 0:
+            raise DeadlineExceeded(f"超过{self.deadline}秒截止时间")
+        return remaining
+
+    async def run_async(
+        self,
+        breaker: CircuitBreaker,
+        func: Callable[..., Awaitable[Any]],
+        *args,
+        label: str = "请求",
+        gate: Optional[Callable[[], AsyncContextManager]] = None
+    ) -> Any:
+        """
+        执行异步调用，全部失败时抛出最后一次的异常
+        gate为每次尝试前需要进入的上下文(如准入名额)，在其中排队的时间不计入截止时间，排队失败也不计入熔断
+        """
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            if not breaker.allow():
+                raise CircuitOpenError(f"{breaker.name}已熔断")
+            try:
+                queued_at = time.monotonic()
+                async with gate() if gate else nullcontext():
+                    started += time.monotonic() - queued_at
+                    result = await asyncio.wait_for(func(*args), self._remaining(started))
+            except asyncio.TimeoutError:
+                breaker.record_failure()
+                raise DeadlineExceeded(f"超过{self.deadline}秒截止时间")
+            except Exception as e:
+                self.record(breaker, e)
+                delay = self.next_delay(attempt, e, started)
+                if delay is None:
+                    raise
+                attempt += 1
+                print(f"{label}失败，{delay:.1f}秒后进行第{attempt}次重试: {str(e)}")
+                await asyncio.sleep(delay)
+                continue
+            breaker.record_success()
+            return result
+
+    def run(self, breaker: CircuitBreaker, func: Callable[..., Any], *args, label: str = "请求") -> Any:
+        """同步版本，在线程池中调用；单次尝试的超时由调用方(如httpx的timeout)控制"""
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            if not breaker.allow():
+                raise CircuitOpenError(f"{breaker.name}已熔断")
+            self._remaining(started)
+            try:
+                result = func(*args)
+            except Exception as e:
+                self.record(breaker, e)
+                delay = self.next_delay(attempt, e, started)
+                if delay is None:
+                    raise
+                attempt += 1
+                print(f"{label}失败，{delay:.1f}秒后进行第{attempt}次重试: {str(e)}")
+                time.sleep(delay)
+                continue
+            breaker.record_success()
+            return result
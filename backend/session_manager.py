@@ -0,0 +1,112 @@
+import asyncio
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from config import Config
+from conversation import ConversationHistory
+from llm import LLMService
+from main_agent import MainAgent
+
+
+class Session:
+    """单个会话的状态：对话缓冲区、用户信息和记忆集合"""
+    def __init__(self, session_id: str, llm_service: LLMService):
+        self.session_id = session_id
+        self.conversation_history = ConversationHistory(
+            max_turns=Config.MAX_TURNS,
+            session_id=session_id
+        )
+        self.main_agent = MainAgent(
+            llm_service,
+            self.conversation_history,
+            user_info_file=self.user_info_path(session_id)
+        )
+        # 同一会话的请求串行处理，避免对话顺序错乱
+        self.lock = asyncio.Lock()
+        self.last_active = time.monotonic()
+
+    @staticmethod
+    def user_info_path(session_id: str) -> str:
+        """默认会话沿用原来的me.txt，其它会话各自保存"""
+        if session_id == "default":
+            return './save/me.txt'
+        digest = hashlib.sha1(session_id.encode('utf-8')).hexdigest()[:16]
+        return os.path.join('./save/users', f'{digest}.txt')
+
+    def touch(self) -> None:
+        self.last_active = time.monotonic()
+
+
+class SessionManager:
+    """
+    按session_id管理会话
+    空闲超过SESSION_IDLE_TIMEOUT的会话会被回收，会话数超过SESSION_MAX_COUNT时回收最久未使用的会话，
+    回收前会把缓冲区里的对话归档到该会话的记忆中
+    """
+    def __init__(self, llm_service: LLMService):
+        self.llm_service = llm_service
+        self.idle_timeout = Config.SESSION_IDLE_TIMEOUT
+        self.max_sessions = Config.SESSION_MAX_COUNT
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._sweeper: Optional[asyncio.Task] = None
+
+    def get(self, session_id: Optional[str]) -> Session:
+        """获取会话，不存在时创建"""
+        session_id = session_id or "default"
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = Session(session_id, self.llm_service)
+            self._sessions[session_id] = session
+            self._evict_overflow(keep=session_id)
+        self._sessions.move_to_end(session_id)
+        session.touch()
+        return session
+
+    def _evict_overflow(self, keep: str) -> None:
+        """会话数超过上限时回收最久未使用且空闲的会话，keep为正要返回的会话，不回收"""
+        for session_id in list(self._sessions.keys()):
+            if len(self._sessions) <= self.max_sessions:
+                break
+            if session_id != keep and not self._sessions[session_id].lock.locked():
+                self._close(self._sessions.pop(session_id))
+
+    def _evict_idle(self) -> None:
+        now = time.monotonic()
+        for session_id, session in list(self._sessions.items()):
+            if now - session.last_active > self.idle_timeout and not session.lock.locked():
+                self._close(self._sessions.pop(session_id))
+
+    @staticmethod
+    def _close(session: Session) -> None:
+        """回收会话，把缓冲区中的对话放入归档队列"""
+        print(f"回收会话: {session.session_id}")
+        try:
+            session.conversation_history.archive_all()
+        except Exception as e:
+            print(f"归档会话{session.session_id}时出错: {e}")
+
+    async def _sweep_loop(self) -> None:
+        while True:
+            await asyncio.sleep(Config.SESSION_SWEEP_INTERVAL)
+            self._evict_idle()
+
+    def start(self) -> None:
+        """启动后台回收任务"""
+        if self._sweeper is None:
+            self._sweeper = asyncio.get_running_loop().create_task(self._sweep_loop())
+
+    async def stop(self) -> None:
+        """停止后台回收任务，并归档所有会话"""
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            self._sweeper = None
+        sessions = list(self._sessions.values())
+        self._sessions.clear()
+        for session in sessions:
+            self._close(session)
+
+    def __len__(self) -> int:
+        return len(self._sessions)
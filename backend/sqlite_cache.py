@@ -0,0 +1,125 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+
+class SQLiteLRUCache:
+    """
+    键值缓存：内存LRU在前，SQLite持久化在后，磁盘条目超过上限时按最近访问时间淘汰
+    子类通过_encode/_decode决定值在磁盘上的存储格式，通过_is_fresh让过期的值视为未命中
+    内存和数据库各用一把锁，查内存不会等待正在进行的磁盘读写
+    """
+    def __init__(self, path: str, table: str, column: str, memory_size: int, max_entries: int):
+        self.path = path
+        self.table = table
+        self.column = column
+        self.memory_size = memory_size
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._memory: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            f"key TEXT PRIMARY KEY, {column} BLOB NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._db.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_last_access ON {table}(last_access)")
+        self._db.commit()
+        self._count = self._db.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+    def _encode(self, value: Any) -> Any:
+        return value
+
+    def _decode(self, raw: Any) -> Any:
+        return raw
+
+    def _is_fresh(self, value: Any) -> bool:
+        return True
+
+    def get_memory(self, key: str) -> Optional[Any]:
+        """只查内存LRU，不访问磁盘，可以在事件循环中直接调用；未命中时不计数，由随后的get查磁盘"""
+        with self._lock:
+            value = self._memory.get(key)
+            if value is not None and not self._is_fresh(value):
+                del self._memory[key]
+                value = None
+            if value is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+            return value
+
+    def get(self, key: str) -> Optional[Any]:
+        value = self.get_memory(key)
+        if value is not None:
+            return value
+
+        with self._db_lock:
+            row = self._db.execute(f"SELECT {self.column} FROM {self.table} WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                self._db.execute(f"UPDATE {self.table} SET last_access = ? WHERE key = ?", (time.time(), key))
+                self._db.commit()
+        value = self._decode(row[0]) if row is not None else None
+        with self._lock:
+            if value is None or not self._is_fresh(value):
+                self.misses += 1
+                return None
+            self._remember(key, value)
+            self.hits += 1
+            return value
+
+    def put(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._remember(key, value)
+        with self._db_lock:
+            exists = self._db.execute(f"SELECT 1 FROM {self.table} WHERE key = ?", (key,)).fetchone()
+            self._db.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, {self.column}, last_access) VALUES (?, ?, ?)",
+                (key, self._encode(value), time.time())
+            )
+            if not exists:
+                self._count += 1
+            if self._count > self.max_entries:
+                self._evict()
+            self._db.commit()
+
+    def delete(self, key: str) -> None:
+        """删除某条缓存(如调用方发现内容不可用)"""
+        with self._lock:
+            self._memory.pop(key, None)
+        with self._db_lock:
+            if self._db.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,)).rowcount:
+                self._count -= 1
+            self._db.commit()
+
+    def _remember(self, key: str, value: Any) -> None:
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def _evict(self) -> None:
+        """淘汰最久未访问的条目，多淘汰10%避免每次写入都触发淘汰"""
+        excess = self._count - self.max_entries + max(1, self.max_entries // 10)
+        self._db.execute(
+            f"DELETE FROM {self.table} WHERE key IN "
+            f"(SELECT key FROM {self.table} ORDER BY last_access ASC LIMIT ?)",
+            (excess,)
+        )
+        self._count = self._db.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "memory_entries": len(self._memory),
+            "disk_entries": self._count
+        }
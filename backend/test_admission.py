@@ -0,0 +1,113 @@
+import asyncio
+
+import pytest
+
+from admission import AdmissionController, AdmissionError
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_background_cannot_take_reserved_slot():
+    async def main():
+        controller = AdmissionController(max_in_flight=2, reserved_interactive=1)
+        await controller.acquire("background")
+        waiter = asyncio.ensure_future(controller.acquire("background"))
+        await asyncio.sleep(0)
+        assert not waiter.done()
+
+        # 保留的名额仍然可以给交互请求
+        await asyncio.wait_for(controller.acquire("interactive"), timeout=1)
+        assert controller.in_flight == 2
+        waiter.cancel()
+    run(main())
+
+
+def test_interactive_waiter_goes_first():
+    async def main():
+        controller = AdmissionController(max_in_flight=1, reserved_interactive=0)
+        await controller.acquire("interactive")
+        order = []
+
+        async def take(priority):
+            await controller.acquire(priority)
+            order.append(priority)
+
+        background = asyncio.ensure_future(take("background"))
+        await asyncio.sleep(0)
+        interactive = asyncio.ensure_future(take("interactive"))
+        await asyncio.sleep(0)
+
+        controller.release("interactive")
+        await interactive
+        assert order == ["interactive"]
+        controller.release("interactive")
+        await background
+        assert order == ["interactive", "background"]
+    run(main())
+
+
+def test_queue_timeout_raises():
+    async def main():
+        controller = AdmissionController(max_in_flight=1, reserved_interactive=0, timeouts={"background": 0.05})
+        await controller.acquire("interactive")
+        with pytest.raises(AdmissionError):
+            await controller.acquire("background")
+        assert controller.waiting == 0
+    run(main())
+
+
+def test_full_queue_rejects():
+    async def main():
+        controller = AdmissionController(max_in_flight=1, reserved_interactive=0, max_waiting=1)
+        await controller.acquire()
+        waiter = asyncio.ensure_future(controller.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionError):
+            await controller.acquire()
+        waiter.cancel()
+    run(main())
+
+
+def test_cancelled_waiter_releases_granted_slot():
+    async def main():
+        controller = AdmissionController(max_in_flight=1, reserved_interactive=0)
+        await controller.acquire()
+        waiter = asyncio.ensure_future(controller.acquire())
+        await asyncio.sleep(0)
+
+        # 名额刚分给等待者，等待者就被取消：名额必须归还
+        controller.release()
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert controller.in_flight == 0
+        await asyncio.wait_for(controller.acquire(), timeout=1)
+    run(main())
+
+
+def test_cancelled_waiter_leaves_queue():
+    async def main():
+        controller = AdmissionController(max_in_flight=1, reserved_interactive=0)
+        await controller.acquire()
+        waiter = asyncio.ensure_future(controller.acquire())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert controller.waiting == 0
+
+        controller.release()
+        assert controller.in_flight == 0
+    run(main())
+
+
+def test_slot_releases_on_error():
+    async def main():
+        controller = AdmissionController(max_in_flight=1, reserved_interactive=0)
+        with pytest.raises(RuntimeError):
+            async with controller.slot("background"):
+                raise RuntimeError("boom")
+        assert controller.in_flight == 0
+    run(main())
@@ -0,0 +1,67 @@
+import asyncio
+import csv
+import io
+
+import pytest
+
+from csv_stream import iter_csv_rows, stream_csv_transform
+
+TEXT = (
+    'name,note,score\r\n'
+    '张三,"第一行\n第二行",90\n'
+    '李四,"带,逗号",80\n'
+    '王五,"他说""你好""",70\n'
+    '赵六,"""开头\n\n结尾""",60\n'
+    '孙七,,50'
+)
+
+
+class FakeUpload:
+    """模拟UploadFile，只提供async read(size)"""
+    def __init__(self, data: bytes):
+        self.stream = io.BytesIO(data)
+
+    async def read(self, size: int) -> bytes:
+        return self.stream.read(size)
+
+
+def read_rows(data: bytes, chunk_size: int):
+    async def main():
+        return [row async for row in iter_csv_rows(FakeUpload(data), chunk_size)]
+    return asyncio.run(main())
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 64, 4096])
+def test_rows_match_csv_reader(chunk_size):
+    # 任意块大小(包括切在多字节字符和引号中间)都与一次性解析相同
+    expected = list(csv.reader(io.StringIO(TEXT)))
+    assert read_rows(TEXT.encode("utf-8"), chunk_size) == expected
+
+
+def test_embedded_newlines_stay_in_field():
+    rows = read_rows(TEXT.encode("utf-8"), 5)
+    assert rows[1] == ["张三", "第一行\n第二行", "90"]
+    assert rows[4] == ["赵六", '"开头\n\n结尾"', "60"]
+    assert len(rows) == 6
+
+
+def test_unclosed_quote_is_flushed_at_end():
+    rows = read_rows('a,b\n"未闭合\nc,d'.encode("utf-8"), 4)
+    assert rows[0] == ["a", "b"]
+    assert rows[1] == ["未闭合\nc,d"]
+
+
+def test_empty_source():
+    assert read_rows(b"", 8) == []
+
+
+def test_transform_and_flush():
+    async def main():
+        source = FakeUpload(TEXT.encode("utf-8"))
+        drop_header = lambda row, index: None if index == 0 else row + ["OK"]
+        return [chunk async for chunk in stream_csv_transform(source, drop_header, flush_bytes=16)]
+    chunks = asyncio.run(main())
+    assert len(chunks) > 1
+    rows = list(csv.reader(io.StringIO(b"".join(chunks).decode("utf-8"))))
+    expected = [row + ["OK"] for row in csv.reader(io.StringIO(TEXT))][1:]
+    assert rows == expected
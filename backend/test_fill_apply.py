@@ -0,0 +1,86 @@
+import numpy as np
+import pandas as pd
+
+from fill_apply import apply_cells
+
+
+def make_df():
+    return pd.DataFrame({
+        "age": [25.0, np.nan, 31.0],
+        "name": ["张三", None, "赵六"],
+        "empty": [np.nan, np.nan, np.nan],
+        "count": pd.array([1, None, 3], dtype="Int64")
+    })
+
+
+def reasons(rejected):
+    return {(cell["row"], cell["column"]): cell["reason"] for cell in rejected}
+
+
+def test_fills_numeric_and_text():
+    df = make_df()
+    rejected = apply_cells(df, [
+        {"row": 1, "column": "age", "content": "28"},
+        {"row": 1, "column": "name", "content": "李四"}
+    ])
+    assert rejected == []
+    assert df.loc[1, "age"] == 28.0
+    assert df.loc[1, "name"] == "李四"
+
+
+def test_rejections():
+    df = make_df()
+    rejected = apply_cells(df, [
+        {"row": 0, "column": "age", "content": "30"},
+        {"row": 1, "column": "age", "content": "abc"},
+        {"row": 9, "column": "age", "content": "1"},
+        {"row": 1.5, "column": "age", "content": "1"},
+        {"row": 1, "column": "missing", "content": "1"},
+        {"row": 1, "column": "name", "content": "  "},
+        {"row": 1, "column": "name", "content": "李四"},
+        {"row": 1, "column": "name", "content": "王五"},
+        "not a cell"
+    ])
+    found = reasons(rejected)
+    assert found[(0, "age")] == "单元格原本不为空"
+    assert found[(1, "age")] == "类型不匹配(应为数值)"
+    assert found[(9, "age")] == "行不存在"
+    assert found[(1.5, "age")] == "行号无效"
+    assert found[(1, "missing")] == "列不存在"
+    assert found[(None, None)] == "行号无效"
+    # 第一次出现的空内容被拒绝后，保留之后第一个有效内容，再之后的作为重复拒绝
+    assert [cell["reason"] for cell in rejected if cell["column"] == "name"] == ["内容为空", "重复的单元格"]
+    assert df.loc[1, "name"] == "李四"
+    assert df.loc[0, "age"] == 25.0
+    assert pd.isna(df.loc[1, "age"])
+
+
+def test_all_nan_column_takes_numbers_or_text():
+    df = make_df()
+    assert apply_cells(df, [{"row": 0, "column": "empty", "content": "1.5"}]) == []
+    assert df.loc[0, "empty"] == 1.5
+
+    df = make_df()
+    assert apply_cells(df, [
+        {"row": 0, "column": "empty", "content": "1.5"},
+        {"row": 1, "column": "empty", "content": "备注"}
+    ]) == []
+    assert df["empty"].tolist()[:2] == ["1.5", "备注"]
+
+
+def test_integer_column_stays_integer():
+    df = make_df()
+    assert apply_cells(df, [{"row": 1, "column": "count", "content": "2"}]) == []
+    assert str(df["count"].dtype) == "Int64"
+    assert df["count"].tolist() == [1, 2, 3]
+
+
+def test_integer_column_widens_for_fraction():
+    df = make_df()
+    assert apply_cells(df, [{"row": 1, "column": "count", "content": "2.5"}]) == []
+    assert df["count"].tolist() == [1.0, 2.5, 3.0]
+
+
+def test_no_cells():
+    df = make_df()
+    assert apply_cells(df, []) == []
@@ -0,0 +1,56 @@
+import json
+
+import pytest
+
+from llm import JSONStringFieldExtractor
+
+REPLY = {
+    "user_info": "喜欢\"猫\"",
+    "reply": "第一段\n\n第二段 \"引号\" \\ 反斜杠 é 😀 结束",
+    "expression": "脸红"
+}
+
+
+def feed_all(extractor, chunks):
+    return "".join(extractor.feed(chunk) for chunk in chunks)
+
+
+def test_whole_text():
+    extractor = JSONStringFieldExtractor("reply")
+    text = json.dumps(REPLY, ensure_ascii=False)
+    assert extractor.feed(text) == REPLY["reply"]
+    assert extractor.done
+    assert extractor.text == REPLY["reply"]
+
+
+@pytest.mark.parametrize("ensure_ascii", [False, True])
+def test_every_split_point(ensure_ascii):
+    # 在任意位置切分(包括转义序列和代理对中间)，结果都与一次性解码相同
+    text = json.dumps(REPLY, ensure_ascii=ensure_ascii)
+    for split in range(1, len(text)):
+        extractor = JSONStringFieldExtractor("reply")
+        assert feed_all(extractor, [text[:split], text[split:]]) == REPLY["reply"], split
+
+
+def test_one_character_at_a_time():
+    text = json.dumps(REPLY, ensure_ascii=True)
+    extractor = JSONStringFieldExtractor("reply")
+    assert feed_all(extractor, list(text)) == REPLY["reply"]
+
+
+def test_text_after_field_is_ignored():
+    extractor = JSONStringFieldExtractor("reply")
+    extractor.feed('{"reply": "你好"')
+    assert extractor.feed(', "expression": "脸红"}') == ""
+    assert extractor.text == "你好"
+
+
+def test_missing_field_yields_nothing():
+    extractor = JSONStringFieldExtractor("reply")
+    assert feed_all(extractor, ['{"answer": ', '"你好"}']) == ""
+    assert not extractor.done
+
+
+def test_key_with_spaces_before_value():
+    extractor = JSONStringFieldExtractor("reply")
+    assert feed_all(extractor, ['{"reply"', ' :\n  "', '好耶"}']) == "好耶"
@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+
+from prefill import PrefillEngine
+
+
+def suggestions_for(df, column):
+    engine = PrefillEngine()
+    return {cell["row"]: cell for cell in engine.suggest(df) if cell["column"] == column}
+
+
+def accepted_for(df, column):
+    engine = PrefillEngine()
+    accepted, _ = engine.split(engine.suggest(df))
+    return {cell["row"]: cell["content"] for cell in accepted if cell["column"] == column}
+
+
+def test_dependency():
+    df = pd.DataFrame({
+        "name": ["张三", "李四", "张三", "李四", "张三", "李四"],
+        "dept": ["研发部", "市场部", "研发部", np.nan, np.nan, "市场部"]
+    })
+    cells = suggestions_for(df, "dept")
+    assert cells[3]["content"] == "市场部" and cells[3]["method"] == "dependency"
+    assert cells[4]["content"] == "研发部"
+    assert accepted_for(df, "dept") == {3: "市场部", 4: "研发部"}
+
+
+def test_sequence_interior_only():
+    df = pd.DataFrame({"id": [1, 2, np.nan, 4, 5, 6, np.nan]})
+    cells = suggestions_for(df, "id")
+    assert cells[2]["content"] == 3 and cells[2]["confidence"] == 0.95
+    assert cells[6]["content"] == 7 and cells[6]["confidence"] < 0.85
+    assert accepted_for(df, "id") == {2: 3}
+
+
+def test_sequence_needs_enough_points():
+    # 只有3个已知值时不作为数列外推
+    df = pd.DataFrame({"score": [90, 80, 70, np.nan, np.nan]})
+    assert accepted_for(df, "score") == {}
+
+
+def test_date_sequence():
+    df = pd.DataFrame({"day": ["2024-01-01", "2024-01-02", None, "2024-01-04", "2024-01-05", "2024-01-06"]})
+    cells = suggestions_for(df, "day")
+    assert cells[2]["content"] == "2024-01-03" and cells[2]["method"] == "sequence"
+
+
+def test_constant():
+    df = pd.DataFrame({"city": ["广州", "广州", None, "广州"]})
+    cells = suggestions_for(df, "city")
+    assert cells[2]["content"] == "广州" and cells[2]["confidence"] >= 0.85
+
+
+def test_runs_between_equal_neighbours():
+    df = pd.DataFrame({"group": ["A", "A", "A", None, "A", "B", "B", "B", "B"]})
+    cells = suggestions_for(df, "group")
+    assert cells[3]["content"] == "A"
+
+
+def test_statistic_is_not_accepted():
+    df = pd.DataFrame({"value": [3.0, 10.0, np.nan, 1.0, 7.0]})
+    cells = suggestions_for(df, "value")
+    assert cells[2]["confidence"] < 0.85
+    assert accepted_for(df, "value") == {}
+
+
+def test_all_nan_and_full_columns_are_skipped():
+    df = pd.DataFrame({"empty": [np.nan, np.nan, np.nan], "full": [1, 2, 3]})
+    assert PrefillEngine().suggest(df) == []
+
+
+def test_contents_are_native_types():
+    df = pd.DataFrame({"id": [1.0, 2.0, np.nan, 4.0, 5.0, 6.0]})
+    content = suggestions_for(df, "id")[2]["content"]
+    assert type(content) is int
@@ -0,0 +1,122 @@
+import json
+import os
+
+import pytest
+
+from prompt_builder import PromptBuilder
+from tokens import count_tokens
+
+PROMPTS_DIR = os.path.join(os.path.dirname(__file__), "prompts")
+
+
+def load(name):
+    with open(os.path.join(PROMPTS_DIR, name), "r", encoding="utf-8") as f:
+        return f.read()
+
+
+TEMPLATE = load("reply.txt")
+TURN_TEMPLATE = load("reply_turn.txt")
+
+
+def make_history(count, size=40):
+    return [(f"问题{i}" + "问" * size, f"回答{i}" + "答" * size) for i in range(count)]
+
+
+def single(max_tokens, min_history_turns=2):
+    return PromptBuilder(TEMPLATE, max_tokens=max_tokens, min_history_turns=min_history_turns)
+
+
+def chat(max_tokens, min_history_turns=2):
+    return PromptBuilder(TEMPLATE, max_tokens=max_tokens, min_history_turns=min_history_turns,
+                         layout="chat", turn_template=TURN_TEMPLATE)
+
+
+def test_everything_fits():
+    builder = single(100000)
+    history = make_history(5)
+    prompt, report = builder.build(history, "你好", "记忆", "信息")
+    assert report["history_turns"] == 5
+    assert "你好" in prompt and "记忆" in prompt and "信息" in prompt
+    assert report["total"] <= builder.max_tokens
+
+
+def test_history_trimmed_before_memory():
+    builder = single(1)
+    base = builder.template_tokens + count_tokens("你好")
+    history = make_history(10)
+    turn_tokens = count_tokens(PromptBuilder._format_turn(*history[0])) + 1
+    # 预算只够放下4轮对话和记忆
+    builder.max_tokens = base + turn_tokens * 4 + count_tokens("记忆") + 2
+    prompt, report = builder.build(history, "你好", "记忆", "")
+    assert report["history_turns"] == 4
+    assert report["memory"] == count_tokens("记忆")
+    assert history[-1][1] in prompt and history[5][0] not in prompt
+
+
+def test_tiny_budget_keeps_one_turn_and_user_message():
+    # 预算比模板还小：记忆和用户信息被清空，对话只留最近一轮，用户消息完整保留
+    builder = single(10, min_history_turns=3)
+    history = make_history(6)
+    prompt, report = builder.build(history, "最新的问题", "很长的记忆" * 50, "很长的信息" * 50)
+    assert report["history_turns"] == 1
+    assert history[-1][0] in prompt
+    assert "最新的问题" in prompt
+    assert report["memory"] <= count_tokens(PromptBuilder.TRUNCATED)
+    assert report["user_info"] <= count_tokens(PromptBuilder.TRUNCATED)
+
+
+@pytest.mark.parametrize("budget", [-100, -1, 0, 1])
+def test_truncate_negative_and_small_budgets(budget):
+    builder = single(1000)
+    assert builder._truncate("一些文本", budget) in ("", PromptBuilder.TRUNCATED)
+    assert builder._truncate("", budget) == ""
+
+
+def test_truncate_keeps_head_within_budget():
+    builder = single(1000)
+    text = "开头" + "内容" * 200
+    budget = 30
+    result = builder._truncate(text, budget)
+    assert result.startswith("开头") and result.endswith(PromptBuilder.TRUNCATED)
+    assert count_tokens(result) <= budget + 1
+
+
+def test_chat_system_prompt_has_no_placeholders():
+    system = PromptBuilder.chat_system_prompt(TEMPLATE)
+    assert PromptBuilder.INPUT_START not in system
+    assert PromptBuilder.CHAT_INPUT_NOTE in system
+    assert "{{" not in system and "{chat_history}" not in system and "{user_message}" not in system
+
+
+def test_chat_replays_history_as_json():
+    builder = chat(100000)
+    history = make_history(2)
+    messages, report = builder.build(history, "你好", "记忆", "信息")
+    assert [m["role"] for m in messages] == ["system", "user", "assistant", "user", "assistant", "user"]
+    assert messages[0]["content"] == builder.system_prompt
+    assert json.loads(messages[2]["content"]) == {"reply": history[0][1]}
+    assert "你好" in messages[-1]["content"] and "记忆" in messages[-1]["content"]
+    assert report["history_turns"] == 2
+
+
+def test_chat_trims_in_one_step_and_keeps_prefix():
+    builder = chat(1, min_history_turns=2)
+    history = make_history(6)
+    turn_tokens = count_tokens(history[0][0] + PromptBuilder._assistant_content(history[0][1])) + 1
+    builder.max_tokens = builder.template_tokens + count_tokens("你好") + turn_tokens * 6 + 2
+
+    messages, report = builder.build(history, "你好", "", "")
+    assert report["history_turns"] == 6
+
+    # 超出预算：一次裁到min_history_turns轮，而不是只丢掉最早一轮
+    history.append(("问题6" + "问" * 40, "回答6" + "答" * 40))
+    messages, report = builder.build(history, "你好", "", "")
+    assert report["history_turns"] == 2
+    prefix = messages[:3]
+
+    # 之后几轮从保留的最早一轮开始追加，前缀不变，直到再次超出预算
+    for i in range(7, 10):
+        history.append((f"问题{i}" + "问" * 40, f"回答{i}" + "答" * 40))
+        messages, report = builder.build(history, "你好", "", "")
+        assert messages[:3] == prefix
+        assert report["history_turns"] == i - 4
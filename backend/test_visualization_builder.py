@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from visualization_builder import VisualizationBuilder, lttb_indices
+
+
+@pytest.mark.parametrize("n, threshold", [(10, 3), (10, 9), (11, 10), (1000, 100), (1001, 7)])
+def test_lttb_shape(n, threshold):
+    y = np.sin(np.arange(n) / 7.0)
+    indices = lttb_indices(y, threshold)
+    assert len(indices) == threshold
+    assert indices[0] == 0 and indices[-1] == n - 1
+    assert (np.diff(indices) > 0).all()
+
+
+@pytest.mark.parametrize("threshold", [0, 2, 10, 11])
+def test_lttb_keeps_everything_when_not_reducing(threshold):
+    y = np.arange(10, dtype=float)
+    assert lttb_indices(y, threshold).tolist() == list(range(10))
+
+
+def test_lttb_keeps_spike():
+    y = np.zeros(1000)
+    y[517] = 100.0
+    assert 517 in lttb_indices(y, 20)
+
+
+def test_lttb_empty_and_single():
+    assert lttb_indices(np.array([]), 5).tolist() == []
+    assert lttb_indices(np.array([1.0]), 5).tolist() == [0]
+
+
+def test_line_chart_downsamples_each_series_and_keeps_gaps():
+    value = np.arange(2000, dtype=float)
+    gappy = np.cos(np.arange(2000) / 50.0)
+    gappy[::3] = np.nan
+    df = pd.DataFrame({"value": value, "gappy": gappy})
+    line = VisualizationBuilder(max_points=100).build(df)["chart_data"]["line"]
+    assert 0 < len(line["categories"]) <= 100
+    assert line["categories"][0] == 0 and line["categories"][-1] == 1999
+    for series in line["series"]:
+        assert len(series["data"]) == len(line["categories"])
+        assert all(point is None or np.isfinite(point) for point in series["data"])
+
+
+def test_all_nan_column_becomes_gaps():
+    df = pd.DataFrame({"empty": [np.nan] * 5, "value": [1.0, 2.0, 3.0, 4.0, 5.0]})
+    line = VisualizationBuilder().build(df)["chart_data"]["line"]
+    assert line["categories"] == [0, 1, 2, 3, 4]
+    assert line["series"][0] == {"name": "empty", "data": [None] * 5}
+
+    line = VisualizationBuilder().build(df[["empty"]])["chart_data"]["line"]
+    assert line == {"categories": [], "series": [{"name": "empty", "data": []}]}
@@ -0,0 +1,39 @@
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    # 没有安装tiktoken(或无法加载编码表)时使用粗略估算
+    _encoding = None
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算token数：中文大约一字一token，英文大约四个字符一token"""
+    if not text:
+        return 0
+    ascii_count = sum(1 for char in text if ord(char) < 128)
+    return (len(text) - ascii_count) + ascii_count // 4 + 1
+
+
+def count_tokens(text: str) -> int:
+    """计算token数，安装了tiktoken时使用分词器，否则估算"""
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return estimate_tokens(text)
+
+
+def truncate_to_tokens(text: str, max_tokens: int, counter=estimate_tokens) -> str:
+    """把文本截断到token数不超过max_tokens"""
+    if max_tokens <= 0:
+        return ""
+    if counter(text) <= max_tokens:
+        return text
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if counter(text[:middle]) <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    return text[:low]
@@ -1,6 +1,10 @@
 from fish_audio_sdk import Session, TTSRequest
-from typing import Optional
-import time
+from fish_audio_sdk.exceptions import HttpCodeErr
+from typing import Optional, List
+import re
+from config import Config
+from executors import run_blocking
+from resilience import APIStatusError, RetryPolicy, get_breaker
 
 class TTSService:
     def __init__(self, api_key: str, reference_id: str):
@@ -9,21 +13,56 @@ class TTSService:
         self.session = Session(api_key)
     
     def generate_audio(self, text: str) -> bytes:
-        max_retries = 3
-        retry_delay = 1  # 初始延迟1秒
+        """合成语音，失败时按指数退避加抖动重试(最多3次尝试)，全部失败或TTS服务熔断时返回空音频"""
+        policy = RetryPolicy(max_retries=2, base_delay=1, deadline=Config.TTS_REQUEST_DEADLINE)
         
-        for attempt in range(max_retries):
+        def attempt() -> bytes:
             try:
-                audio_data = b"".join(self.session.tts(TTSRequest(
+                return b"".join(self.session.tts(TTSRequest(
                     reference_id=self.reference_id,
                     text=text
                 )))
-                return audio_data
-            except Exception as e:
-                if attempt < max_retries - 1:  # 如果不是最后一次尝试
-                    print(f"TTS Error on attempt {attempt + 1}: {str(e)}")
-                    time.sleep(retry_delay)
-                    retry_delay *= 2  # 指数退避，每次失败后等待时间翻倍
-                else:
-                    print(f"TTS Error: All {max_retries} attempts failed. Last error: {str(e)}")
-                    return b""  # 所有重试都失败后返回空音频数据 
\ No newline at end of file
+            except HttpCodeErr as e:
+                # 转换为状态码错误，只重试可重试的状态码，5xx计入熔断
+                raise APIStatusError("TTS", e.status) from e
+        
+        try:
+            return policy.run(get_breaker("TTS"), attempt, label="TTS")
+        except Exception as e:
+            print(f"TTS Error: {str(e)}")
+            return b""  # 所有重试都失败后返回空音频数据
+
+    async def generate_audio_async(self, text: str) -> bytes:
+        """在TTS专用的有界线程池中合成语音，不阻塞事件循环"""
+        return await run_blocking("tts", Config.TTS_MAX_WORKERS, self.generate_audio, text)
+
+
+class SentenceSplitter:
+    """把流式生成的文本切分成完整的句子，便于逐句合成语音"""
+    _boundary = re.compile(r'[^。！？!?；;~～…\n]*(?:[。！？!?；;~～…]+|\n+)')
+
+    def __init__(self, min_length: int = 0):
+        self.min_length = min_length
+        self._buffer = ""
+
+    def feed(self, text: str) -> List[str]:
+        """加入新文本，返回已经完整的句子"""
+        self._buffer += text
+        sentences = []
+        pending = ""
+        end = 0
+        for match in self._boundary.finditer(self._buffer):
+            end = match.end()
+            pending += match.group()
+            # 太短的句子先攒着，和后面的句子一起合成
+            if len(pending.strip()) >= self.min_length:
+                sentences.append(pending.strip())
+                pending = ""
+        self._buffer = pending + self._buffer[end:]
+        return sentences
+
+    def flush(self) -> Optional[str]:
+        """返回剩余的不完整句子"""
+        rest = self._buffer.strip()
+        self._buffer = ""
+        return rest or None
@@ -0,0 +1,138 @@
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from column_profiler import ColumnProfile
+
+
+OTHER_LABEL = "其他"
+
+
+def to_json_list(values) -> List[Any]:
+    """转换为可JSON序列化的列表，NaN/inf转为None"""
+    array = np.asarray(values)
+    if array.dtype.kind == "f":
+        result = array.astype(object)
+        result[~np.isfinite(array)] = None
+        return result.tolist()
+    return array.tolist()
+
+
+def lttb_indices(y: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets降采样，返回保留点的下标
+    x取位置序号，首尾点始终保留，其余每个桶保留与前一个保留点和下一个桶均值构成三角形面积最大的点
+    """
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    
+    x = np.arange(n, dtype=float)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    selected = np.empty(threshold, dtype=int)
+    selected[0] = 0
+    selected[-1] = n - 1
+    prev = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        next_start, next_end = edges[i + 1], edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[next_start:next_end].mean() if next_end > next_start else x[-1]
+        avg_y = y[next_start:next_end].mean() if next_end > next_start else y[-1]
+        bucket_x = x[start:end]
+        bucket_y = y[start:end]
+        areas = np.abs(
+            (x[prev] - avg_x) * (bucket_y - y[prev]) - (x[prev] - bucket_x) * (avg_y - y[prev])
+        )
+        prev = start + int(np.argmax(areas))
+        selected[i + 1] = prev
+    return selected
+
+
+class VisualizationBuilder:
+    """
+    生成前端图表数据：分组和计数全部向量化计算
+    分类数超过上限时保留前N个，其余合并为"其他"；长数值序列用LTTB降采样；各图表数据按列存储
+    """
+    def __init__(self, max_categories: int = 20, max_points: int = 500):
+        self.max_categories = max_categories
+        self.max_points = max_points
+
+    def build(self, df: pd.DataFrame, profile: Optional[ColumnProfile] = None) -> Dict[str, Any]:
+        profile = profile or ColumnProfile(df)
+        numeric_cols = profile.numeric_columns
+        category_cols = profile.category_columns
+        
+        viz_data = {
+            "columns": df.columns.tolist(),
+            "numeric_columns": numeric_cols,
+            "category_columns": category_cols,
+            "chart_data": {}
+        }
+        
+        # 有分类列时按第一个分类列对第一个数值列分组求均值，否则画数值列折线图
+        if numeric_cols and category_cols:
+            viz_data["chart_data"]["bar"] = self.bar_chart(
+                df[category_cols[0]], profile.numeric[numeric_cols[0]], numeric_cols[0]
+            )
+        elif numeric_cols:
+            viz_data["chart_data"]["line"] = self.line_chart(
+                df.index, {col: profile.numeric[col] for col in numeric_cols}
+            )
+        
+        # 饼图使用第一个分类列的计数
+        if category_cols:
+            viz_data["chart_data"]["pie"] = self.pie_chart(df[category_cols[0]])
+        
+        return viz_data
+
+    def _top_categories(self, categories: pd.Series) -> pd.Series:
+        """把分类值映射为字符串，前N个以外的值归为"其他"，空值保持为NaN"""
+        labels = categories.astype("string")
+        counts = labels.value_counts(dropna=True)
+        if len(counts) <= self.max_categories:
+            return labels
+        top = counts.index[:self.max_categories - 1]
+        return labels.where(labels.isin(top) | labels.isna(), OTHER_LABEL)
+
+    def pie_chart(self, categories: pd.Series) -> Dict[str, Any]:
+        counts = self._top_categories(categories).value_counts(dropna=True, sort=False)
+        counts = self._order(counts, counts)
+        return {
+            "names": counts.index.tolist(),
+            "values": to_json_list(counts.to_numpy(dtype=np.int64))
+        }
+
+    def bar_chart(self, categories: pd.Series, values: pd.Series, name: str) -> Dict[str, Any]:
+        grouped = values.groupby(self._top_categories(categories), dropna=True).agg(["mean", "size"])
+        grouped = self._order(grouped, grouped["size"])
+        return {
+            "categories": grouped.index.tolist(),
+            "series": [{"name": name, "data": to_json_list(grouped["mean"].to_numpy(dtype=float))}]
+        }
+
+    @staticmethod
+    def _order(data, counts: pd.Series):
+        """按数量降序排列，"其他"放在最后"""
+        order = counts.sort_values(ascending=False, kind="stable").index
+        if OTHER_LABEL in order:
+            order = order.drop(OTHER_LABEL).append(pd.Index([OTHER_LABEL]))
+        return data.reindex(order)
+
+    def line_chart(self, index: pd.Index, series: Dict[str, pd.Series]) -> Dict[str, Any]:
+        """每列各自做LTTB降采样，合并保留下标后按同一横轴输出"""
+        n = len(index)
+        per_series = max(self.max_points // max(len(series), 1), 3)
+        keep = np.zeros(n, dtype=bool)
+        arrays = {}
+        for col, values in series.items():
+            y = values.to_numpy(dtype=float)
+            arrays[col] = y
+            valid = np.flatnonzero(np.isfinite(y))
+            if len(valid):
+                keep[valid[lttb_indices(y[valid], per_series)]] = True
+        positions = np.flatnonzero(keep)
+        return {
+            "categories": to_json_list(index.to_numpy()[positions]),
+            "series": [{"name": col, "data": to_json_list(y[positions])} for col, y in arrays.items()]
+        }
@@ -6,6 +6,19 @@ import LoadingDots from './components/LoadingDots'
 import VisualizerModal from './components/VisualizerModal'
 import TypewriterText from './components/TypewriterText'
 
+// 轮询后台任务直到结束，返回任务结果
+const waitForJob = async (submitResult) => {
+  if (!submitResult.job_id) return submitResult
+  while (true) {
+    await new Promise(resolve => setTimeout(resolve, 1000))
+    const response = await fetch(`http://localhost:8000/api/jobs/${submitResult.job_id}`)
+    const job = await response.json()
+    if (job.status === 'succeeded') return job.result
+    if (job.status === 'failed') return { success: false, message: job.error }
+    if (!response.ok) return { success: false, message: job.detail }
+  }
+}
+
 function App() {
   const [input, setInput] = useState('')
   const [messages, setMessages] = useState([])
@@ -69,6 +82,7 @@ function App() {
     if (fillRequirement) {
       formData.append('requirement', fillRequirement)
     }
+    formData.append('background', 'true')
   
     try {
       const response = await fetch('http://localhost:8000/api/upload-csv', {
@@ -76,7 +90,7 @@ function App() {
         body: formData,
       })
       
-      const result = await response.json()
+      const result = await waitForJob(await response.json())
       setCsvResult(result)
       
       // 添加处理结果的消息
@@ -211,11 +225,12 @@ function App() {
           'Content-Type': 'application/json',
         },
         body: JSON.stringify({ file_path: filePath ,
-          requirement: fillRequirement 
+          requirement: fillRequirement,
+          background: true
         }),
       })
       
-      const result = await response.json()
+      const result = await waitForJob(await response.json())
       
       if (result.success) {
         // 保存分析结果
@@ -188,7 +188,7 @@ function DataVisualizer({ data, analysisResult }) {
               type: 'pie',
               radius: '55%',
               center: ['50%', '60%'],
-              data: chartData.pie.data,
+              data: chartData.pie.names.map((name, i) => ({ name, value: chartData.pie.values[i] })),
               emphasis: {
                 itemStyle: {
                   shadowBlur: 10,